@@ -0,0 +1,139 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from logging import getLogger
+import threading
+import time
+
+log = getLogger(__name__)
+
+WILDCARDS = "*?["
+
+
+class Broker():
+    """Routes messages from publishers to the subscribers of a topic. Topics of subscribers can
+    be wildcards like "gui.*".
+
+    Subscribers are indexed by topic, the subscribers for a wildcard are resolved once per topic.
+    Delivery happens on a thread pool, so route never blocks the publisher. Each subscriber has
+    its own queue that is worked off by one task at a time, so it gets its messages in order.
+    """
+    def __init__(self, max_workers: int = 4):
+        self.topics = {}
+        self.patterns = {}
+        self._routes = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="Broker")
+
+    def attach(self, subscriber: Subscriber):
+        "Attach a Subscriber or an object that has one as sub."
+        subscriber = getattr(subscriber, "sub", subscriber)
+        with self._lock:
+            for topic in subscriber.topics:
+                index = self.patterns if any(c in topic for c in WILDCARDS) else self.topics
+                index.setdefault(topic, set()).add(subscriber)
+            self._routes.clear()
+
+    def detach(self, subscriber: Subscriber):
+        subscriber = getattr(subscriber, "sub", subscriber)
+        with self._lock:
+            for index in (self.topics, self.patterns):
+                for subscribers in index.values():
+                    subscribers.discard(subscriber)
+            self._routes.clear()
+
+    def route(self, topic, message: str):
+        sent = time.perf_counter()
+        for subscriber in self._subscribers(topic):
+            subscriber.enqueue(message, sent, self._pool)
+
+    def _subscribers(self, topic) -> tuple[Subscriber]:
+        try:
+            return self._routes[topic]
+        except KeyError:
+            pass
+        with self._lock:
+            subscribers = set(self.topics.get(topic, ()))
+            for pattern, pattern_subscribers in self.patterns.items():
+                if fnmatchcase(topic, pattern):
+                    subscribers |= pattern_subscribers
+            route = self._routes[topic] = tuple(subscribers)
+        return route
+
+    def close(self):
+        """Deliver the messages that are still queued, including the ones published on the way,
+        and stop the delivery threads."""
+        with self._lock:
+            subscribers = set().union(*self.topics.values(), *self.patterns.values())
+        while any(subscriber.busy for subscriber in subscribers):
+            time.sleep(0.001)
+        self._pool.shutdown(wait=True)
+
+
+class Publisher():
+    def __init__(self, broker: Broker):
+        self.broker = broker
+
+    def publish(self, topic, message):
+        return self.broker.route(topic, message)
+
+
+class Subscriber():
+    """Calls the callbacks in routes for the messages it receives on topics.
+
+    Keeps counters of the delivery: delivered, the mean and maximum latency between publishing
+    and the callbacks being called, and the current and maximum depth of its queue."""
+    def __init__(self, topics: list[str], routes: dict):
+        self.topics = topics
+        self.routes = routes
+        self.queue = deque()
+        self.delivered = 0
+        self.latency_total = 0.
+        self.latency_max = 0.
+        self.depth_max = 0
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def enqueue(self, message, sent: float, pool: ThreadPoolExecutor):
+        with self._lock:
+            self.queue.append((message, sent))
+            self.depth_max = max(self.depth_max, len(self.queue))
+            if self._scheduled:
+                return
+            self._scheduled = True
+        pool.submit(self._deliver)
+
+    def _deliver(self):
+        while True:
+            with self._lock:
+                if not self.queue:
+                    self._scheduled = False
+                    return
+                message, sent = self.queue.popleft()
+            latency = time.perf_counter() - sent
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.delivered += 1
+            try:
+                self.receive(message)
+            except Exception:
+                log.exception(f"Subscriber failed to handle {message}")
+
+    def receive(self, message):
+        callbacks = self.routes.get(message, [])
+        for callback in callbacks:
+            callback()
+
+    @property
+    def busy(self) -> bool:
+        return self._scheduled
+
+    @property
+    def depth(self) -> int:
+        return len(self.queue)
+
+    def stats(self) -> dict:
+        return {"delivered": self.delivered, "depth": self.depth, "depth_max": self.depth_max,
+                "latency_mean": self.latency_total/max(self.delivered, 1),
+                "latency_max": self.latency_max}
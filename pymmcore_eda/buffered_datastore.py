@@ -2,14 +2,24 @@ from leb.kpal.buffer import BufferedArray
 from pymmcore_plus import CMMCorePlus
 import numpy as np
 from useq import MDAEvent
+from collections import deque
+from logging import getLogger
 import copy
+import threading
+import time
 from psygnal import Signal
+from pymmcore_eda.frame_index import (DIMENSIONS, FrameIndex, FrameState, SharedFrameIndex,
+                                      frame_state, frame_stats, record_stats)
+
+log = getLogger(__name__)
 
 mmcore = CMMCorePlus.instance()
 mmcore.loadSystemConfiguration()
 
-DIMENSIONS = ["c", "z", "t", "p", "g"]
 CAPACITY = int(30E8)
+SAVE_TIMEOUT = 10  # s to wait for a saver before overwriting frames it hasn't saved
+HEARTBEAT_INTERVAL = 1  # s between the signs of life of a SaveCursor
+HEARTBEAT_TIMEOUT = 5  # s without a sign of life after which a saver is considered gone
 
 def complement_indices(event):
     indeces = dict(copy.deepcopy(dict(event.index)))
@@ -19,7 +29,29 @@ def complement_indices(event):
     return indeces
 
 
+class FrameOverwrittenError(IndexError):
+    "The frame has been overwritten by newer frames in the ring buffer."
+
+
 class BufferedDataStore(BufferedArray):
+    """Ring buffer in shared memory that the frames of an acquisition are written to.
+
+    The frame index is published in a second shared memory segment named after the buffer, so
+    that a BufferedDataStore attached with create=False in another process can look up any frame
+    that is still in the buffer without being told where it is. Frames from an attached store
+    are read-only views into the shared memory.
+
+    Every record carries the generation of the buffer it was written in, i.e. how often the
+    buffer had wrapped around. Together with the number of elements written so far this tells in
+    O(1) whether a frame is still valid, see frame_state.
+
+    The statistics of every frame are computed once in new_frame and stored in its record, any
+    consumer can query them with get_stats instead of scanning the pixels again.
+
+    A SaveCursor lets a saver in any process write the frames straight from the shared memory,
+    new_frame waits for it before it overwrites frames that are not saved yet. A saver that has
+    not been seen for HEARTBEAT_TIMEOUT, or that does not catch up within SAVE_TIMEOUT, is
+    dropped, so it can hold up the acquisition only once."""
     frame_ready = Signal(MDAEvent, tuple, int)
 
     def __new__(self, *args, **kwargs):
@@ -29,33 +61,138 @@ class BufferedDataStore(BufferedArray):
     def __init__(self, *args, **kwargs):
         super().__init__()
         setattr(self, "complement_indices", complement_indices)
-        #TODO: This limits the sizes of the axes
-        self.indeces_to_idx = np.zeros([3,1,1000, 3], np.uint64)
-        mmcore.mda.events.frameReady.connect(self.new_frame)
+        self.shared_index = SharedFrameIndex(name=f"{self._shm.name}_index",
+                                             create=kwargs.get("create", True))
+        if self.shared_index.owner:
+            self.indeces_to_idx = FrameIndex()
+            mmcore.mda.events.frameReady.connect(self.new_frame)
+        else:
+            self.indeces_to_idx = self.shared_index
 
     def new_frame(self, img: np.ndarray, event: MDAEvent):
         idx = self._write_idx
-        indices = self.complement_indices(event)
-        print(indices)
-        try:
-            self.indeces_to_idx[indices['c'], indices['z'], indices['t']] = (int(img.shape[0]),
-                                                                            int(img.shape[1]),
-                                                                            int(idx))
-        except IndexError:
-            shape_now = self.indeces_to_idx.shape
-            new_min_shape = [indices['c'], indices['z'], indices['t']]
-            diff = [x - y for x, y in zip(new_min_shape, shape_now)]
-            for i, app in enumerate(diff):
-                self.indeces_to_idx.append(i, app)
-            print("New shape for indeces:", self.indeces_to_idx.shape)
+        start = self.shared_index.written
+        generation = start // self.size
+        stats = frame_stats(img)
+        self._wait_for_saver(start + img.size - self.size)
+        self.indeces_to_idx.add(event.index, offset=idx, generation=generation, shape=img.shape,
+                                **stats)
+        # Announce the write before the data is overwritten, readers check against this
+        self.shared_index.written = start + img.size
         self.put(img)
-        print("BufferedDataStore", self.indeces_to_idx[indices['c'], indices['z'], indices['t']])
+        self.shared_index.add(event.index, offset=idx, generation=generation, shape=img.shape,
+                              dtype=self.dtype, timestamp=time.time(), stats=stats)
         self.frame_ready.emit(event, img.shape, idx)
 
-    def get_frame(self, indeces: list):
-        width, height, index = self.indeces_to_idx[*indeces]
+    def _wait_for_saver(self, position: int):
+        """Wait until a saver has everything before position on disk. A saver that has not
+        been seen alive for HEARTBEAT_TIMEOUT or that doesn't get there in time is
+        unregistered."""
+        deadline = time.perf_counter() + SAVE_TIMEOUT
+        while (saved := self.shared_index.saved) is not None and saved < position:
+            if self.shared_index.heartbeat_age > HEARTBEAT_TIMEOUT:
+                log.error("Saver is gone, overwriting frames that are not saved")
+                self.shared_index.unregister_cursor()
+                return
+            if time.perf_counter() > deadline:
+                log.error("Saver is not keeping up, overwriting frames from now on")
+                self.shared_index.unregister_cursor()
+                return
+            time.sleep(0.0005)
+
+    def get_frame(self, indeces: list|dict):
+        """Frame for indeces, either an MDAEvent index or a list ordered like DIMENSIONS.
+        Raises FrameOverwrittenError if the frame is not in the buffer anymore."""
+        record = self.indeces_to_idx[indeces]
+        width, height = (int(x) for x in record["shape"])
+        index = int(record["offset"])
         index1 = index + width*height
-        return np.reshape(self[index:index1], [width, height])
+        if index1 > self.size:
+            # The frame wrapped around the end of the buffer
+            frame = np.concatenate([self[index:], self[:index1 - self.size]]).view(np.ndarray)
+        elif self.shared_index.owner:
+            frame = self[index:index1]
+        else:
+            frame = self[index:index1].view(np.ndarray)
+        frame = np.reshape(frame, [width, height])
+        if not self.shared_index.owner:
+            frame.flags.writeable = False
+        if self.frame_state(record) == FrameState.EVICTED:
+            raise FrameOverwrittenError(f"Frame {indeces} has been overwritten")
+        return frame
+
+    def get_stats(self, indeces: list|dict) -> dict:
+        """min, max, mean, sum and histogram of the frame for indeces, see frame_stats. They stay
+        available after the frame has been overwritten, until its record is reused."""
+        return record_stats(self.indeces_to_idx[indeces])
+
+    def frame_state(self, record: np.void) -> FrameState:
+        """Whether the data of a record is still valid, has been acquired again (stale) or has
+        been overwritten (evicted). Readers holding on to a frame should check again after
+        using the data."""
+        try:
+            latest = int(self.indeces_to_idx[record["index"]]["seq"])
+        except IndexError:
+            return FrameState.EVICTED
+        return frame_state(record, self.shared_index.written, self.size, latest)
+
+    def close(self):
+        self.shared_index.close()
+        super().close()
+
+
+class SaveCursor:
+    """Cursor of a saver that writes frames straight from the shared memory of a
+    BufferedDataStore, usually an attached one. Frames are added in the order they were acquired
+    and are released in any order, once they are saved or failed to save. Everything up to the
+    first frame that is not released is published in the shared index, the datastore doesn't
+    overwrite anything after it. A thread tells the datastore that the saver is alive every
+    HEARTBEAT_INTERVAL, until the cursor is closed or the process is gone."""
+    def __init__(self, datastore: BufferedDataStore):
+        self.datastore = datastore
+        self.shared_index = datastore.shared_index
+        self.failed = 0
+        self._frames = deque()
+        self._lock = threading.Lock()
+        self.shared_index.register_cursor()
+        self._closed = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self):
+        while not self._closed.wait(HEARTBEAT_INTERVAL):
+            self.shared_index.beat()
+
+    def add(self, indeces: list|dict) -> tuple[np.ndarray, callable, callable]:
+        """Frame for indeces, a view into the shared memory, the function to call once it is
+        saved and the one to call if saving it failed. Raises FrameOverwrittenError if the frame
+        is gone already, nothing is added then."""
+        record = self.datastore.indeces_to_idx[indeces]
+        frame = self.datastore.get_frame(indeces)
+        start = int(record["generation"])*self.datastore.size + int(record["offset"])
+        entry = [start, start + int(np.prod(record["shape"])), False]
+        with self._lock:
+            self._frames.append(entry)
+        return frame, lambda: self._release(entry), lambda: self._release(entry, saved=False)
+
+    def _release(self, entry: list, saved: bool = True):
+        if not saved:
+            self.failed += 1
+            log.warning(f"Frame at {entry[0]} was not saved, releasing it to the datastore")
+        with self._lock:
+            entry[2] = True
+            end = None
+            while self._frames and self._frames[0][2]:
+                end = self._frames.popleft()[1]
+            if self._frames:
+                self.shared_index.saved = self._frames[0][0]
+            elif end is not None:
+                self.shared_index.saved = end
+
+    def close(self):
+        self._closed.set()
+        self._heartbeat.join()
+        self.shared_index.unregister_cursor()
 
 
 if __name__ == "__main__":
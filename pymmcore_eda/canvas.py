@@ -14,6 +14,10 @@ from pymmcore_eda.archive.event_bus import EventBus
 from pymmcore_eda.utility.index_slider import QLabeledSlider
 from pymmcore_eda.utility.range_slider import RangeSlider
 from pymmcore_eda.utility.color_picker import QColorComboBox
+from pymmcore_eda.utility.autocontrast import AutoContrast, contrast_limits
+from pymmcore_eda.utility.pyramid import Pyramid, PyramidBuilder, choose_level, visible_region
+from vispy.visuals.transforms import STTransform
+from pymmcore_eda.frame_cache import FrameCache, prefetch_keys
 
 
 app.use_app("pyqt6")
@@ -23,18 +27,23 @@ mmcore.loadSystemConfiguration()
 
 DIMENSIONS = ["t", "z", "c", "p", "g"]
 AUTOCLIM_RATE = 1 #Hz   0 = inf
+DISPLAY_RATE = 60 #Hz, frames arriving faster than this are not all shown
 CMAPS = [color.Colormap([[0, 0, 0], [1, 1, 0]]), color.Colormap([[0, 0, 0], [1, 0, 1]]),
          color.Colormap([[0, 0, 0], [0, 1, 1]]), color.Colormap([[0, 0, 0], [1, 0, 0]]),
          color.Colormap([[0, 0, 0], [0, 1, 0]]), color.Colormap([[0, 0, 0], [0, 0, 1]])]
 
 class Canvas(QEventConsumer):
     """A canvas to follow MDA acquisitions started by MDASequence events. Works for remote and local
-    datastores. QEventCosumer handles the connection to the correct events for each version."""
+    datastores. QEventCosumer handles the connection to the correct events for each version.
+    With multiscale, frames are not uploaded at full resolution, but at the level of their
+    Pyramid that fits the zoom of the camera, and only the tiles of it that are visible. Levels
+    are built by a PyramidBuilder, the image stays as it is until the level is ready."""
     _slider_settings = QtCore.Signal(dict)
     _new_channel = QtCore.Signal(int, str)
 
     def __init__(self, event_receiver: QEventReceiver|EventBus|None = None,
-                 datastore = None, *args, **kwargs):
+                 datastore = None, *args, display_rate: float = DISPLAY_RATE,
+                 multiscale: bool = False, **kwargs):
         super().__init__(event_receiver, datastore=datastore)
         self._clim = 'auto'
         self.display_index = {dim: 0 for dim in DIMENSIONS}
@@ -60,6 +69,28 @@ class Canvas(QEventConsumer):
         # self.display_timer.connect(self.on_display_timer)
 
         self.frame = 0
+        self.width, self.height = 0, 0
+        self.multiscale = multiscale
+        self.pyramids = {}
+        self._uploaded = {}
+        # frame_stats of the frame shown per channel, see contrast_source
+        self.stats = {}
+
+        # Latest event per channel that is not displayed yet, see on_render_timer
+        self.mailbox = {}
+        self.frames_shown = 0
+        self.frames_dropped = 0
+        self.render_timer = QtCore.QTimer()
+        self.render_timer.setInterval(int(1000 // display_rate))
+        self.render_timer.timeout.connect(self.on_render_timer)
+        self.render_timer.start()
+
+        self.cache = FrameCache(self.datastore) if datastore is not None else None
+
+        self.autocontrast = AutoContrast()
+        self.autocontrast.limits_ready.connect(self._on_limits)
+        self.pyramid_builder = PyramidBuilder()
+        self.pyramid_builder.level_ready.connect(self._on_level)
 
         self.clim_timer = QtCore.QTimer()
         self.clim_timer.setInterval(int(1000 // AUTOCLIM_RATE))
@@ -78,6 +109,9 @@ class Canvas(QEventConsumer):
 
     def on_sequence_start(self, sequence: MDASequence):
         self.sequence = sequence
+        self.autocontrast.reset()
+        if self.cache is not None:
+            self.cache.invalidate()
         self.handle_sliders(sequence)
         self.handle_channels(sequence, self.datastore)
 
@@ -85,6 +119,9 @@ class Canvas(QEventConsumer):
         nc = sequence.sizes['c']
         print("CHANNEL", nc)
         self.images = []
+        self.pyramids = {}
+        self._uploaded = {}
+        self.stats = {}
         for i in range(nc):
             image = scene.visuals.Image(np.zeros(self._canvas.size).astype(array.dtype),
                                         parent=self.view.scene, cmap=CMAPS[i], clim=[0,1])
@@ -128,7 +165,7 @@ class Canvas(QEventConsumer):
             slider = self.channel_boxes[channel].slider
             self._handle_channel_clim(slider.low(), slider.high(), channel, set_autoscale=False)
         else:
-            clim = (np.min(self.images[channel]._data), np.max(self.images[channel]._data))
+            clim = contrast_limits(self.contrast_source(channel))
             self._handle_channel_clim(clim[0], clim[1], channel, set_autoscale=False)
 
     def handle_sliders(self, sequence: MDASequence):
@@ -174,6 +211,9 @@ class Canvas(QEventConsumer):
             self.channel_row.layout().addWidget(channel_box)
 
     def on_mouse_move(self, event):
+        if self.multiscale:
+            self._show_pixel_info(event)
+            return
         transform = self.images[self.current_channel].get_transform('canvas', 'visual')
         p = [int(x) for x in transform.map(event.pos)]
         if p[0] < 0 or p[1] < 0:
@@ -187,31 +227,81 @@ class Canvas(QEventConsumer):
             info = f"[{p[0]}, {p[1]}]"
             self.info_bar.setText(info)
 
+    def _show_pixel_info(self, event):
+        "Value at the mouse position in full resolution, the images only hold a level or tile."
+        transform = self._canvas.scene.node_transform(self.view.scene)
+        p = [int(x) for x in transform.map(event.pos)[:2]]
+        info = f"[{p[0]}, {p[1]}]"
+        if self.current_channel in self.pyramids:
+            frame = self.pyramids[self.current_channel][0]
+            if 0 <= p[1] < frame.shape[0] and 0 <= p[0] < frame.shape[1]:
+                info += f" = {frame[p[1], p[0]]}"
+        self.info_bar.setText(info)
+
     def on_display_timer(self, _=None):
+        """Show the frames at the index of the sliders. Frames come from the FrameCache, which
+        then prefetches the next ones in the direction the slider moved."""
         old_index = self.display_index.copy()
         for slider in self.sliders:
             self.display_index[slider.name] = slider.value()
         if old_index == self.display_index:
             return
-        for c in range(self.sequence.sizes['c']):
-            frame = self.datastore.get_frame([self.display_index['t'], self.display_index['z'],  c])
+        channels = self.sequence.sizes['c']
+        for c in range(channels):
+            key = [self.display_index['t'], self.display_index['z'], c]
+            frame = self.datastore.get_frame(key) if self.cache is None else self.cache.get(key)
             self.display_image(frame, c)
         self._canvas.update()
+        if self.cache is None:
+            return
+        for axis in ["t", "z"]:
+            if self.display_index[axis] != old_index[axis]:
+                direction = 1 if self.display_index[axis] > old_index[axis] else -1
+                sizes = {slider.name: slider.maximum() + 1 for slider in self.sliders}
+                self.cache.prefetch(prefetch_keys(self.display_index, axis, direction, sizes,
+                                                  channels))
+                break
 
     def on_frame_ready(self, event):
+        """Only note the frame, the latest one of each channel is shown by on_render_timer. A
+        frame that is replaced before it was shown is counted in frames_dropped."""
+        indices = self.complement_indices(event.index)
+        if self.cache is not None:
+            self.cache.invalidate([indices["t"], indices["z"], indices["c"]])
+        if indices["c"] in self.mailbox:
+            self.frames_dropped += 1
+        self.mailbox[indices["c"]] = event
+
+    def on_render_timer(self):
+        mailbox, self.mailbox = self.mailbox, {}
+        for event in mailbox.values():
+            self.show_frame(event)
+            self.frames_shown += 1
+        if self.multiscale:
+            # Follow the camera, upload_level only uploads if the level or tiles changed
+            for channel in self.pyramids:
+                self.upload_level(channel)
+
+    def show_frame(self, event):
         indices = self.complement_indices(event.index)
         img = self.datastore.get_frame([indices["t"], indices["z"], indices["c"]])
         shape = img.shape
-        self.width, self.height = shape
-        if sum(indices.values()) == 0:
+        # The first frame of a sequence might have been dropped, also reset on a new shape
+        if sum(indices.values()) == 0 or (self.width, self.height) != shape:
+            self.width, self.height = shape
             self.view.camera.rect = ((0, 0, *shape))
         self.display_image(img, indices["c"])
         self._set_sliders(indices)
-        slider = self.channel_boxes[indices["c"]].slider
-        slider.setRange(min(slider.minimum(), img.min()), max(slider.maximum(), img.max()))
-        if self.channel_boxes[indices["c"]].autoscale.isChecked():
-            slider.setLow(min(slider.minimum(), img.min()))
-            slider.setHigh(max(slider.maximum(), img.max()))
+        # The datastores compute the statistics of a frame once at ingest
+        try:
+            stats = self.datastore.get_stats([indices["t"], indices["z"], indices["c"]])
+        except (AttributeError, KeyError, IndexError):
+            stats = None
+        self.stats[indices["c"]] = stats
+        if stats is not None:
+            slider = self.channel_boxes[indices["c"]].slider
+            slider.setRange(min(slider.minimum(), int(stats["min"])),
+                            max(slider.maximum(), int(stats["max"])))
         self.on_clim_timer(indices["c"])
 
     def _set_sliders(self, indices: dict):
@@ -221,15 +311,73 @@ class Canvas(QEventConsumer):
             slider.blockSignals(False)
 
     def display_image(self, img: np.ndarray, channel=0):
-        self.images[channel].set_data(img)
-        # self.images[channel].update()
+        if not self.multiscale:
+            self.images[channel].set_data(img)
+            return
+        self.pyramids[channel] = Pyramid(img)
+        self._uploaded.pop(channel, None)
+        self.upload_level(channel)
+
+    def upload_level(self, channel: int):
+        "Upload the visible tiles of the pyramid level of channel that fits the camera."
+        pyramid = self.pyramids[channel]
+        rect = self.view.camera.rect
+        level = choose_level(abs(rect.width)/max(self.view.size[0], 1), len(pyramid))
+        if not pyramid.is_built(level):
+            self.pyramid_builder.submit(pyramid, level, channel)
+            return
+        image = pyramid[level]
+        region = visible_region((rect.left, rect.bottom, abs(rect.width), abs(rect.height)),
+                                image.shape, level)
+        if (self._uploaded.get(channel) == (level, region)
+                or any(part.start == part.stop for part in region)):
+            return
+        self._uploaded[channel] = (level, region)
+        scale = 2**level
+        self.images[channel].set_data(np.ascontiguousarray(image[region]))
+        self.images[channel].transform = STTransform(
+            scale=(scale, scale), translate=(region[1].start*scale, region[0].start*scale))
+
+    def _on_level(self, channel: int, pyramid: Pyramid):
+        "A level from the PyramidBuilder, only uploaded if the pyramid is still shown."
+        if self.pyramids.get(channel) is pyramid:
+            self.upload_level(channel)
 
     def on_clim_timer(self, channel=None):
         channel_list = list(range(len(self.channel_boxes))) if channel is None else [channel]
         for channel in channel_list:
             if self.channel_boxes[channel].autoscale.isChecked() and self.images[channel].visible:
-                clim = np.percentile(self.images[channel]._data, [0, 100])
-                self.images[channel].clim = clim
+                self.autocontrast.submit(self.contrast_source(channel), channel)
+
+    def contrast_source(self, channel: int):
+        """The statistics of the frame shown in channel if they have a histogram, so the limits
+        need no pixels, otherwise the image."""
+        stats = self.stats.get(channel)
+        if stats is not None and np.any(stats["histogram"]):
+            return stats
+        return self.images[channel]._data
+
+    def _on_limits(self, channel: int, low: float, high: float):
+        "Limits from the AutoContrast worker, only applied if the channel is still autoscaled."
+        # Late limits of a channel the current sequence does not have
+        if channel >= min(len(self.images), len(self.channel_boxes)):
+            return
+        slider = self.channel_boxes[channel].slider
+        slider.setRange(min(slider.minimum(), int(low)), max(slider.maximum(), int(high)))
+        if not self.channel_boxes[channel].autoscale.isChecked():
+            return
+        slider.setLow(int(low))
+        slider.setHigh(int(high))
+        self.images[channel].clim = (low, max(high, low + 1))
+        self._canvas.update()
+
+    def closeEvent(self, event):
+        self.render_timer.stop()
+        self.autocontrast.close()
+        self.pyramid_builder.close()
+        if self.cache is not None:
+            self.cache.close()
+        super().closeEvent(event)
 
     def complement_indices(self, index):
         indeces = dict(copy.deepcopy(dict(index)))
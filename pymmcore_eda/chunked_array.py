@@ -0,0 +1,158 @@
+from pathlib import Path
+import json
+import os
+import numpy as np
+import numpy.typing as npt
+
+
+class ChunkedArray:
+    """Array of frames [t, z, c, y, x] that is kept in chunks of chunk_size timepoints.
+
+    Writing to a timepoint after the end allocates the chunks up to it, data that is already
+    there is never copied. Indexing with an integer timepoint returns views into the chunk, like
+    a numpy array would. Slicing along t and np.asarray assemble a contiguous copy.
+    """
+    def __init__(self, shape: tuple, dtype: npt.DTypeLike = np.uint16, chunk_size: int = 1):
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.chunk_shape = (chunk_size, *shape[1:])
+        self.chunks = []
+        self.length = 0
+        self.grow(shape)
+
+    @property
+    def shape(self) -> tuple:
+        return (self.length, *self.chunk_shape[1:])
+
+    @property
+    def ndim(self) -> int:
+        return len(self.chunk_shape)
+
+    @property
+    def nbytes(self) -> int:
+        return self.length*int(np.prod(self.chunk_shape[1:]))*self.dtype.itemsize
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _allocate_chunk(self) -> np.ndarray:
+        return np.zeros(self.chunk_shape, self.dtype)
+
+    def grow(self, shape: tuple):
+        """Make sure the array is at least shape. Growing along t only allocates new chunks,
+        growing any other axis has to copy all chunks."""
+        inner = tuple(max(x, y) for x, y in zip(self.chunk_shape[1:], shape[1:]))
+        if inner != self.chunk_shape[1:]:
+            self.chunk_shape = (self.chunk_size, *inner)
+            old_chunks, self.chunks = self.chunks, []
+            for old in old_chunks:
+                chunk = self._allocate_chunk()
+                chunk[tuple(slice(0, x) for x in old.shape)] = old
+                self.chunks.append(chunk)
+        while len(self.chunks)*self.chunk_size < shape[0]:
+            self.chunks.append(self._allocate_chunk())
+        self.length = max(self.length, shape[0])
+
+    def _split(self, key) -> tuple:
+        key = key if isinstance(key, tuple) else (key,)
+        t = key[0]
+        if isinstance(t, (int, np.integer)):
+            if t < 0:
+                t += self.length
+            if not 0 <= t < self.length:
+                raise IndexError(f"Timepoint {key[0]} out of range for {self.length}")
+        return t, key[1:]
+
+    def __getitem__(self, key):
+        t, rest = self._split(key)
+        if isinstance(t, (int, np.integer)):
+            return self.chunks[t//self.chunk_size][(t % self.chunk_size, *rest)]
+        return np.asarray(self)[(t, *rest)]
+
+    def __setitem__(self, key, value):
+        key = key if isinstance(key, tuple) else (key,)
+        t = key[0]
+        if not isinstance(t, (int, np.integer)) or t < 0:
+            raise IndexError("Only single timepoints can be written to a ChunkedArray")
+        if t >= self.length:
+            self.grow((t + 1, *self.chunk_shape[1:]))
+        self.chunks[t//self.chunk_size][(t % self.chunk_size, *key[1:])] = value
+
+    def __array__(self, dtype=None, copy=None):
+        if not self.chunks:
+            array = np.zeros(self.shape, self.dtype)
+        else:
+            array = np.concatenate(self.chunks)[:self.length]
+        return array if dtype is None else array.astype(dtype)
+
+
+class MappedArray(ChunkedArray):
+    """ChunkedArray whose chunks are memory mapped regions of one raw file at path, for runs that
+    don't fit into RAM. The file is grown sparsely chunk by chunk, the OS keeps the recently
+    written frames in the page cache and writes them back in the background.
+
+    The file is the raw dump of the run: chunks are stored one after the other in C order, so it
+    is a [t, z, c, y, x] array of the shape and dtype in the json sidecar next to it, see load_raw.
+    The sidecar is rewritten whenever the array grows, so it is up to date after a crash.
+    """
+    def __init__(self, path: str|os.PathLike, shape: tuple, dtype: npt.DTypeLike = np.uint16,
+                 chunk_size: int = 1):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "w+b")
+        super().__init__(shape, dtype, chunk_size)
+
+    def _allocate_chunk(self) -> np.memmap:
+        nbytes = int(np.prod(self.chunk_shape))*self.dtype.itemsize
+        offset = len(self.chunks)*nbytes
+        self.file.truncate(offset + nbytes)
+        return np.memmap(self.file, self.dtype, mode="r+", offset=offset, shape=self.chunk_shape)
+
+    def grow(self, shape: tuple):
+        """Growing z or c changes the layout of all chunks, they are copied into a new file that
+        then replaces the old one."""
+        inner = tuple(max(x, y) for x, y in zip(self.chunk_shape[1:], shape[1:]))
+        if inner != self.chunk_shape[1:] and self.chunks:
+            old_file = self.file
+            temp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            self.file = open(temp_path, "w+b")
+            super().grow(shape)
+            old_file.close()
+            os.replace(temp_path, self.path)
+        else:
+            super().grow(shape)
+        self._write_sidecar()
+
+    def _write_sidecar(self):
+        sidecar = sidecar_path(self.path)
+        temp_path = sidecar.with_suffix(".tmp")
+        temp_path.write_text(json.dumps({"shape": list(self.shape), "dtype": self.dtype.str,
+                                         "chunk_size": self.chunk_size}))
+        os.replace(temp_path, sidecar)
+
+    def __array__(self, dtype=None, copy=None):
+        "The whole file as one memmap, without reading it into memory."
+        self.flush()
+        array = np.memmap(self.path, self.dtype, mode="r", shape=self.shape)
+        return array if dtype is None else array.astype(dtype)
+
+    def flush(self):
+        for chunk in self.chunks:
+            chunk.flush()
+
+    def close(self):
+        self.flush()
+        self._write_sidecar()
+        self.chunks = []
+        self.file.close()
+
+
+def sidecar_path(path: str|os.PathLike) -> Path:
+    path = Path(path)
+    return path.with_suffix(path.suffix + ".json")
+
+
+def load_raw(path: str|os.PathLike, mode: str = "r") -> np.memmap:
+    "Open the raw file of a MappedArray as a [t, z, c, y, x] memmap."
+    meta = json.loads(sidecar_path(path).read_text())
+    return np.memmap(path, np.dtype(meta["dtype"]), mode=mode, shape=tuple(meta["shape"]))
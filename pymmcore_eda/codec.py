@@ -0,0 +1,177 @@
+from collections import OrderedDict
+import itertools
+import struct
+import threading
+import time
+import uuid
+import yaml
+from useq import MDAEvent, MDASequence
+from pymmcore_eda.frame_index import DIMENSIONS, index_key
+
+# tag, sequence uid, index, shape, buffer offset, timestamp
+FRAME_READY = struct.Struct(f"<B16s{len(DIMENSIONS)}i2IQd")
+FRAME_READY_TAG = 1
+LOOKAHEAD = 1024  # events of a sequence generated ahead of the one looked up, at most
+KEEP_SEQUENCES = 8  # sequences kept to rebuild events, the oldest are dropped
+
+
+def acquisition_time(event: MDAEvent) -> float:
+    "Time the frame of event was acquired if the event carries it, like a FrameEvent, else now."
+    timestamp = getattr(event, "timestamp", None)
+    return time.time() if timestamp is None else timestamp
+
+
+class YamlCodec:
+    """Encodes the events for the event queue as dicts with the yaml of the MDAEvent or
+    MDASequence. Slow, but carries the complete event."""
+
+    def encode_sequence_started(self, sequence: MDASequence) -> dict:
+        self.sequence_uid = sequence.uid
+        return {"name": "sequence_started", "yaml": sequence.yaml(), "uid": str(sequence.uid)}
+
+    def encode_frame_ready(self, event: MDAEvent, shape: tuple, index: int) -> dict:
+        return {"name": "frame_ready", "yaml": event.yaml(), "shape": shape, "index": index,
+                "timestamp": acquisition_time(event)}
+
+    def encode_sequence_finished(self, sequence: MDASequence) -> dict:
+        return {"name": "sequence_finished", "uid": str(sequence.uid)}
+
+
+class BinaryCodec(YamlCodec):
+    """Encodes frame_ready events relative to the sequence that was sent with sequence_started,
+    as a fixed struct of the sequence uid, frame index, shape, buffer offset and timestamp. The
+    receiver rebuilds the MDAEvent from the sequence. Other events fall back to the YamlCodec."""
+    sequence_uid = uuid.UUID(int=0)
+
+    def encode_frame_ready(self, event: MDAEvent, shape: tuple, index: int) -> bytes:
+        uid = self.sequence_uid if event.sequence is None else event.sequence.uid
+        return FRAME_READY.pack(FRAME_READY_TAG, uid.bytes,
+                                *(event.index.get(dim, 0) for dim in DIMENSIONS),
+                                *shape, index, acquisition_time(event))
+
+
+class FrameEvent:
+    """Event for a frame of a sequence that is only rebuilt as an MDAEvent from the sequence
+    when an attribute other than index is accessed. timestamp is the time the frame was
+    acquired. A complete event can be wrapped by passing it as event, to add the timestamp."""
+
+    def __init__(self, index: dict, decoder: "Decoder|None" = None,
+                 sequence_uid: uuid.UUID|None = None, timestamp: float|None = None,
+                 event: MDAEvent|None = None):
+        self.index = index
+        self.sequence_uid = sequence_uid
+        self.timestamp = timestamp
+        self._decoder = decoder
+        self._event = event
+
+    @property
+    def event(self) -> MDAEvent:
+        if self._event is None:
+            self._event = self._decoder.lookup(self.sequence_uid, self.index)
+        return self._event
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.event, name)
+
+    def __repr__(self) -> str:
+        return f"FrameEvent(index={self.index})"
+
+
+class Decoder:
+    """Decodes messages from the event queue, independent of the codec they were encoded with.
+    Keeps the last KEEP_SEQUENCES sequences that were started, to rebuild the events of compact
+    frame messages."""
+
+    def __init__(self):
+        self.sequences = OrderedDict()
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def decode(self, message: dict|bytes) -> tuple[str, tuple]:
+        "Name of the event and the arguments for the corresponding signal."
+        if isinstance(message, bytes):
+            values = FRAME_READY.unpack(message)
+            index = dict(zip(DIMENSIONS, values[2:len(DIMENSIONS) + 2]))
+            shape = values[len(DIMENSIONS) + 2:len(DIMENSIONS) + 4]
+            event = FrameEvent(index, self, uuid.UUID(bytes=values[1]), timestamp=values[-1])
+            return "frame_ready", (event, tuple(shape), int(values[-2]))
+        match message["name"]:
+            case "frame_ready":
+                seq_dict = yaml.load(message["yaml"], Loader=yaml.FullLoader)
+                event = MDAEvent().model_validate(seq_dict)
+                event = FrameEvent(event.index, timestamp=message.get("timestamp"), event=event)
+                return "frame_ready", (event, tuple(message["shape"]), int(message["index"]))
+            case "sequence_started":
+                seq_dict = yaml.load(message["yaml"], Loader=yaml.FullLoader)
+                sequence = MDASequence().model_validate(seq_dict)
+                if "uid" in message:
+                    # The uid is not part of the yaml, keep it so the frames can refer to it
+                    sequence._uid = uuid.UUID(message["uid"])
+                    with self._lock:
+                        self.sequences[uuid.UUID(message["uid"])] = sequence
+                        while len(self.sequences) > KEEP_SEQUENCES:
+                            self._events.pop(self.sequences.popitem(last=False)[0], None)
+                return "sequence_started", (sequence,)
+            case "sequence_finished":
+                uid = uuid.UUID(message["uid"])
+                with self._lock:
+                    self._events.pop(uid, None)
+                    sequence = self.sequences.get(uid)
+                if sequence is None:
+                    sequence = MDASequence()
+                    sequence._uid = uid
+                return "sequence_finished", (sequence,)
+        return message["name"], ()
+
+    def lookup(self, sequence_uid: uuid.UUID, index: dict) -> MDAEvent:
+        """MDAEvent with index from the sequence with sequence_uid. The events of the sequence are
+        generated in order up to the one looked up, the ones that are skipped are kept until
+        they are looked up. Frames arrive in the order of the sequence, so that is usually just
+        the next event. An index that is not among the next LOOKAHEAD events gets a bare
+        MDAEvent."""
+        key = index_key(index)
+        with self._lock:
+            if sequence_uid not in self.sequences:
+                return MDAEvent(index=index)
+            if sequence_uid not in self._events:
+                self._events[sequence_uid] = (iter(self.sequences[sequence_uid]), OrderedDict())
+            events, skipped = self._events[sequence_uid]
+            if key in skipped:
+                return skipped.pop(key)
+            for event in itertools.islice(events, LOOKAHEAD):
+                if index_key(event.index) == key:
+                    return event
+                skipped[index_key(event.index)] = event
+                if len(skipped) > LOOKAHEAD:
+                    skipped.popitem(last=False)
+        return MDAEvent(index=index)
+
+
+def decode(message: dict|bytes) -> tuple[str, tuple]:
+    "Decode a single message without the sequences sent before."
+    return Decoder().decode(message)
+
+
+if __name__ == "__main__":
+    sequence = MDASequence(
+        channels=[{"config": "DAPI", "exposure": 10}, {"config": "FITC", "exposure": 10}],
+        time_plan={"interval": 0, "loops": 500},
+        z_plan={"range": 4, "step": 1},
+        axis_order="tpcz",
+    )
+    events = list(sequence)
+    for codec in [YamlCodec(), BinaryCodec()]:
+        decoder = Decoder()
+        decoder.decode(codec.encode_sequence_started(sequence))
+        t0 = time.perf_counter()
+        messages = [codec.encode_frame_ready(event, (2048, 2048), i)
+                    for i, event in enumerate(events)]
+        t1 = time.perf_counter()
+        for message in messages:
+            decoder.decode(message)
+        t2 = time.perf_counter()
+        print(f"{codec.__class__.__name__}: encode {len(events)/(t1 - t0):.0f} events/s, "
+              f"decode {len(events)/(t2 - t1):.0f} events/s, "
+              f"{len(str(messages[0]) if isinstance(messages[0], dict) else messages[0])} bytes")
@@ -0,0 +1,84 @@
+from logging import getLogger
+import threading
+import time
+import zlib
+
+log = getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+
+DEFAULT_LEVELS = {"zlib": 1, "zstd": 1, "lz4": 1}
+
+
+class Codec:
+    """Lossless compression of chunks, with the compressor config zarr v2 (numcodecs) needs to
+    read them back. compress is thread safe and the libraries release the GIL, so a thread pool
+    compresses on all cores.
+
+    Counts the bytes going in and out and the time spent, see stats."""
+    def __init__(self, name: str, level: int|None = None):
+        self.name = name
+        self.level = DEFAULT_LEVELS[name] if level is None else level
+        if name == "zstd":
+            self._compress = lambda data: zstandard.ZstdCompressor(level=self.level).compress(data)
+            self.config = {"id": "zstd", "level": self.level}
+        elif name == "lz4":
+            # numcodecs expects the uncompressed size in front of the block, like store_size
+            self._compress = lambda data: lz4.block.compress(data, acceleration=self.level)
+            self.config = {"id": "lz4", "acceleration": self.level}
+        else:
+            self._compress = lambda data: zlib.compress(data, self.level)
+            self.config = {"id": "zlib", "level": self.level}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.
+        self._lock = threading.Lock()
+
+    def compress(self, data) -> bytes:
+        start = time.perf_counter()
+        compressed = self._compress(data)
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.bytes_in += memoryview(data).nbytes
+            self.bytes_out += len(compressed)
+            self.seconds += seconds
+        return compressed
+
+    @property
+    def ratio(self) -> float:
+        return self.bytes_in/self.bytes_out if self.bytes_out else 1.
+
+    @property
+    def throughput(self) -> float:
+        "Uncompressed bytes per second of compression time, summed over all threads."
+        return self.bytes_in/self.seconds if self.seconds else 0.
+
+    def stats(self) -> dict:
+        return {"codec": self.name, "ratio": self.ratio, "throughput": self.throughput,
+                "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+
+def available_codecs() -> list[str]:
+    codecs = ["zlib"]
+    if zstandard is not None:
+        codecs.append("zstd")
+    if lz4 is not None:
+        codecs.append("lz4")
+    return codecs
+
+
+def get_codec(name: str, level: int|None = None) -> Codec:
+    "Codec for name, falls back to zlib if the library for it is not installed."
+    if name not in DEFAULT_LEVELS:
+        raise ValueError(f"Unknown codec {name}, use one of {list(DEFAULT_LEVELS)}")
+    if name not in available_codecs():
+        log.warning(f"{name} is not installed, compressing with zlib")
+        return Codec("zlib", level if name == "zlib" else None)
+    return Codec(name, level)
@@ -1,18 +1,26 @@
 import multiprocessing
+import multiprocessing.queues
+from multiprocessing.connection import wait
 from _queue import Empty
 from pymmcore_eda.buffered_datastore import BufferedDataStore
 from pymmcore_eda.archive.event_bus import EventBus
+from pymmcore_eda.codec import Decoder
+from pymmcore_eda.event_ring import EventRing
+from pymmcore_eda.pubsub import EventSubscriber
 from pymmcore_plus import CMMCorePlus
 from qtpy import QtWidgets, QtCore
 from useq import MDASequence, MDAEvent
+import socket
 import time
-import yaml
+
+WAKEUP_TIMEOUT = 1  # s, only matters if a wakeup from an EventRing got lost
 
 class QEventReceiver(QtCore.QObject):
 
     stop_thread = QtCore.Signal()
 
-    def __init__(self, queue: multiprocessing.Queue, auto_start: bool = True):
+    def __init__(self, queue: multiprocessing.queues.Queue|EventRing|EventSubscriber,
+                 auto_start: bool = True):
         super().__init__()
         self.queue = queue
         self.event_thread = QtCore.QThread()
@@ -24,49 +32,86 @@ class QEventReceiver(QtCore.QObject):
             self.event_thread.start()
 
     def stop(self):
-        pass
-
-    def closeEvent(self):
+        "Stop the listener and wait for its thread to finish."
         self.stop_thread.emit()
+        self.event_thread.quit()
+        self.event_thread.wait()
+
+    def closeEvent(self, event=None):
+        self.stop()
 
 class QEventListener(QtCore.QObject):
+    """Emits the events from the queue as Qt signals. Blocks on a socket while the queue is
+    empty and wakes up as soon as there is a new event or a stop request, then handles all
+    events that have arrived in one go."""
     sequence_started = QtCore.Signal(MDASequence)
-    frame_ready = QtCore.Signal(MDAEvent, tuple, int)
+    # MDAEvent or FrameEvent, that only rebuilds the MDAEvent when needed
+    frame_ready = QtCore.Signal(object, tuple, int)
+    sequence_finished = QtCore.Signal(MDASequence)
     def __init__(self, receiver: QEventReceiver,
-                 queue: multiprocessing.Queue):
+                 queue: multiprocessing.queues.Queue|EventRing|EventSubscriber):
         super().__init__()
         self.receiver = receiver
         self.queue = queue
+        self.decoder = Decoder()
         self.stop_requested = False
-        self.receiver.stop_thread.connect(self.stop)
+        self._wake = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._wake.bind(("127.0.0.1", 0))
+        self._wake.setblocking(False)
+        # The listener thread is blocked in event_loop, stop has to run in the caller's thread
+        self.receiver.stop_thread.connect(self.stop, QtCore.Qt.DirectConnection)
 
     def start(self):
         self.event_loop()
 
     def event_loop(self):
-        while True:
+        if isinstance(self.queue, EventRing):
+            self.queue.set_wakeup(self._wake.getsockname()[1])
+        waitables = [self._wake]
+        if hasattr(self.queue, "_reader"):
+            # multiprocessing.Queue and EventSubscriber, readable when there is an event
+            waitables.append(self.queue._reader)
+        while self.drain():
+            if isinstance(self.queue, EventRing) and not self.queue.prepare_wait():
+                continue
+            wait(waitables, timeout=WAKEUP_TIMEOUT)
+            self._clear_wakeups()
+        self._wake.close()
+
+    def drain(self) -> bool:
+        "Handle all events in the queue. False if the listener should stop."
+        while not self.stop_requested:
             try:
-                event = self.queue.get(timeout=0.5)
+                event = self.queue.get_nowait()
             except Empty:
-                if self.stop_requested:
-                    break
-                else:
-                    continue
-            match event["name"]:
+                return True
+            name, args = self.decoder.decode(event)
+            match name:
                 case "stop":
                     print("STOP EventListener")
-                    break
+                    return False
                 case "frame_ready":
-                    seq_dict = yaml.load(event["yaml"], Loader=yaml.FullLoader)
-                    my_event = MDAEvent().model_validate(seq_dict)
-                    print("FRAME READY in Listener", my_event.__class__)
-                    self.frame_ready.emit(my_event, tuple(event["shape"]), int(event["index"]))
+                    self.frame_ready.emit(*args)
                 case "sequence_started":
-                    seq_dict = yaml.load(event["yaml"], Loader=yaml.FullLoader)
-                    self.sequence_started.emit(MDASequence().model_validate(seq_dict))
+                    self.sequence_started.emit(*args)
+                case "sequence_finished":
+                    self.sequence_finished.emit(*args)
+        return False
+
+    def _clear_wakeups(self):
+        try:
+            while True:
+                self._wake.recv(64)
+        except (BlockingIOError, OSError):
+            pass
 
     def stop(self):
         self.stop_requested = True
+        try:
+            self._wake.sendto(b"\0", self._wake.getsockname())
+        except OSError:
+            # Already stopped
+            pass
 
 
 class QEventConsumer(QtWidgets.QWidget):
@@ -79,21 +124,26 @@ class QEventConsumer(QtWidgets.QWidget):
             self.event_receiver = datastore.listener
             self.events.sequence_started = self.listener.sequenceStarted
             self.events.frame_ready = self.listener.frameReady
+            self.events.sequence_finished = self.listener.sequenceFinished
         else:
             self.event_receiver = event_receiver
             self.event_receiver = QEventReceiver() if event_receiver is None else event_receiver
             self.listener = event_receiver.listener
             self.events.sequence_started = self.listener.sequence_started
             self.events.frame_ready = self.listener.frame_ready
+            self.events.sequence_finished = self.listener.sequence_finished
         print("DATASTORE", datastore)
         if datastore is not None:
             print("Datastore set")
             self.datastore = datastore
             self.events.frame_ready = self.datastore.frame_ready
+            # A local datastore delivers the start and end of a sequence in order with its frames
+            for name in ["sequence_started", "sequence_finished"]:
+                if hasattr(datastore, name):
+                    setattr(self.events, name, getattr(datastore, name))
 
     def closeEvent(self, event):
         self.event_receiver.closeEvent(event)
-        time.sleep(1)
         self.hide()
         super().closeEvent(event)
 
@@ -0,0 +1,153 @@
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty, Full
+import pickle
+import socket
+import struct
+import time
+import numpy as np
+from pymmcore_eda.frame_index import _attach
+
+HEADER = ["head", "tail", "slots", "slot_size", "waiting", "wake_port"]
+# length of the payload, 1 if the payload is pickled
+RECORD = struct.Struct("<IB")
+SPIN_TIME = 0.002  # s to spin before sleeping while waiting
+POLL_INTERVAL = 0.0002
+
+
+class EventRing:
+    """Lock-free ring of fixed size event records in shared memory for a single producer and a
+    single consumer, with the put/get interface of a multiprocessing.Queue.
+
+    bytes are stored as they are, other messages are pickled. A message that does not fit into
+    one record takes up several consecutive ones. The producer only ever writes head, the
+    consumer only tail, each after the records they refer to have been written or read.
+    Passing an EventRing to another process attaches to the same memory.
+
+    A consumer that does not want to poll registers a local UDP port with set_wakeup and calls
+    prepare_wait before it blocks on its socket. The producer then sends a datagram to that port
+    when it puts the next message, so the consumer needs no CPU while the ring is empty.
+    """
+    def __init__(self, name: str|None = None, create: bool = True, slots: int = 8192,
+                 slot_size: int = 128):
+        if create:
+            self._shm = SharedMemory(name=name, create=True,
+                                     size=len(HEADER)*8 + slots*slot_size)
+        else:
+            self._shm = _attach(name)
+        self.owner = create
+        self.name = self._shm.name
+        self.header = np.ndarray(len(HEADER), np.uint64, buffer=self._shm.buf)
+        if create:
+            self.header[:] = [0, 0, slots, slot_size, 0, 0]
+        self.slots, self.slot_size = (int(x) for x in self.header[2:4])
+        self.data = np.ndarray(self.slots*self.slot_size, np.uint8, buffer=self._shm.buf,
+                               offset=self.header.nbytes)
+        self._wake_socket = None
+
+    def put(self, message, block: bool = True, timeout: float|None = None):
+        if isinstance(message, bytes):
+            payload, pickled = message, 0
+        else:
+            payload, pickled = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL), 1
+        record = RECORD.pack(len(payload), pickled) + payload
+        n_slots = -(-len(record)//self.slot_size)
+        if n_slots > self.slots:
+            raise ValueError(f"Message of {len(record)} bytes does not fit into the ring")
+        head = int(self.header[0])
+        if not self._wait(lambda: self.slots - (head - int(self.header[1])) >= n_slots,
+                          block, timeout):
+            raise Full
+        self._write((head % self.slots)*self.slot_size, record)
+        self.header[0] = head + n_slots
+        if self.header[4]:
+            self.header[4] = 0
+            self._wake()
+
+    def put_nowait(self, message):
+        self.put(message, block=False)
+
+    def get(self, block: bool = True, timeout: float|None = None):
+        tail = int(self.header[1])
+        if not self._wait(lambda: int(self.header[0]) != tail, block, timeout):
+            raise Empty
+        start = (tail % self.slots)*self.slot_size
+        length, pickled = RECORD.unpack(self._read(start, RECORD.size))
+        payload = self._read(start + RECORD.size, length)
+        self.header[1] = tail + -(-(RECORD.size + length)//self.slot_size)
+        return pickle.loads(payload) if pickled else payload
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def empty(self) -> bool:
+        return int(self.header[0]) == int(self.header[1])
+
+    def qsize(self) -> int:
+        "Number of records in use, a message can take up several."
+        return int(self.header[0]) - int(self.header[1])
+
+    def set_wakeup(self, port: int):
+        "Local UDP port the producer sends a datagram to, to wake up a waiting consumer."
+        self.header[5] = port
+
+    def prepare_wait(self) -> bool:
+        """Ask the producer for a wakeup on the next message. False if a message has arrived in
+        the meantime, the consumer should not block then."""
+        self.header[4] = 1
+        if not self.empty():
+            self.header[4] = 0
+            return False
+        return True
+
+    def _wake(self):
+        if self._wake_socket is None:
+            self._wake_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._wake_socket.setblocking(False)
+        try:
+            self._wake_socket.sendto(b"\0", ("127.0.0.1", int(self.header[5])))
+        except OSError:
+            # The consumer is gone or its socket is full, it will find the message anyway
+            pass
+
+    def _write(self, start: int, record: bytes):
+        start = start % self.data.size
+        first = min(len(record), self.data.size - start)
+        self.data[start:start + first] = np.frombuffer(record, np.uint8, first)
+        if first < len(record):
+            self.data[:len(record) - first] = np.frombuffer(record, np.uint8, offset=first)
+
+    def _read(self, start: int, length: int) -> bytes:
+        start = start % self.data.size
+        first = min(length, self.data.size - start)
+        data = self.data[start:start + first].tobytes()
+        if first < length:
+            data += self.data[:length - first].tobytes()
+        return data
+
+    def _wait(self, condition, block: bool, timeout: float|None) -> bool:
+        "Spin, then poll until condition is met. False if it was not met before timeout."
+        if condition():
+            return True
+        if not block:
+            return False
+        start = time.perf_counter()
+        while not condition():
+            now = time.perf_counter()
+            if timeout is not None and now - start > timeout:
+                return False
+            time.sleep(0 if now - start < SPIN_TIME else POLL_INTERVAL)
+        return True
+
+    def close(self):
+        if self._wake_socket is not None:
+            self._wake_socket.close()
+        del self.header, self.data
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __getstate__(self):
+        return {"name": self.name}
+
+    def __setstate__(self, state):
+        self.__init__(name=state["name"], create=False)
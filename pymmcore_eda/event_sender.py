@@ -1,9 +1,19 @@
 from useq import MDASequence, MDAEvent
 from pymmcore_eda.buffered_datastore import BufferedDataStore
+from pymmcore_eda.codec import BinaryCodec, YamlCodec
+from pymmcore_eda.event_ring import EventRing
+from pymmcore_eda.pubsub import EventPublisher
 from pymmcore_plus import CMMCorePlus
 import sys
 import multiprocessing
+import multiprocessing.queues
 from psygnal import Signal
+from logging import getLogger
+from queue import Full
+
+log = getLogger(__name__)
+
+PUT_TIMEOUT = 0.05  # s the acquisition waits for room in a full EventRing before it drops events
 
 mmcore = CMMCorePlus.instance()
 mmcore.loadSystemConfiguration()
@@ -11,27 +21,63 @@ mmcore.loadSystemConfiguration()
 class EventSender:
     """An event bus that can be used as a hub for pymmcore driven applications with the possibility
     to have an event_receiver in another process that communicates via an event queue.
+    Events are encoded by codec, a BinaryCodec by default, a YamlCodec sends complete events.
+    Without an event_queue, events are sent through an EventRing in shared memory named after
+    the datastore, "<datastore>_events", that the receiver can attach to. To serve several
+    receivers, pass an EventPublisher and give them EventSubscribers for its address.
+
+    If the EventRing is full, because no receiver attached or it stopped reading, events are
+    dropped after PUT_TIMEOUT and without waiting until there is room again, so the
+    acquisition never stalls. They are counted in dropped.
     """
 
-    def __init__(self, datastore: BufferedDataStore, event_queue: multiprocessing.Queue = None,
-                 *args, **kwargs):
+    def __init__(self, datastore: BufferedDataStore,
+                 event_queue: multiprocessing.queues.Queue|EventRing|EventPublisher|None = None,
+                 *args, codec: YamlCodec|None = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.datastore = datastore
+        self.owns_queue = event_queue is None
+        if event_queue is None:
+            event_queue = EventRing(name=f"{datastore._shm.name}_events")
         self.event_queue = event_queue
+        self.dropped = 0
+        self._dropping = False
+        self.codec = BinaryCodec() if codec is None else codec
 
         # Connect events to be transmitted to EventReceiver
         mmcore.mda.events.sequenceStarted.connect(self.on_sequence_start)
+        mmcore.mda.events.sequenceFinished.connect(self.on_sequence_finish)
         self.datastore.frame_ready.connect(self.on_frame_ready)
 
     def on_frame_ready(self, event:MDAEvent, shape: tuple, index: int):
-        self.event_queue.put({"name": "frame_ready", "yaml": event.yaml(), "shape": shape,
-                              "index": index})
+        self.put(self.codec.encode_frame_ready(event, shape, index))
 
     def on_sequence_start(self, sequence: MDASequence):
-        self.event_queue.put({"name": "sequence_started", "yaml": sequence.yaml()})
+        self.put(self.codec.encode_sequence_started(sequence))
+
+    def on_sequence_finish(self, sequence: MDASequence):
+        self.put(self.codec.encode_sequence_finished(sequence))
+
+    def put(self, message):
+        if not isinstance(self.event_queue, EventRing):
+            self.event_queue.put(message)
+            return
+        try:
+            self.event_queue.put(message, timeout=0 if self._dropping else PUT_TIMEOUT)
+        except Full:
+            if not self._dropping:
+                log.warning("Event ring is full, dropping events until the receiver catches up")
+            self._dropping = True
+            self.dropped += 1
+        else:
+            self._dropping = False
 
     def closeEvent(self):
-        pass
+        mmcore.mda.events.sequenceStarted.disconnect(self.on_sequence_start)
+        mmcore.mda.events.sequenceFinished.disconnect(self.on_sequence_finish)
+        self.datastore.frame_ready.disconnect(self.on_frame_ready)
+        if self.owns_queue:
+            self.event_queue.close()
 
 
 
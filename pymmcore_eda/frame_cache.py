@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from logging import getLogger
+import threading
+import numpy as np
+
+log = getLogger(__name__)
+
+CACHE_BUDGET = 512*2**20  # bytes
+PREFETCH_DEPTH = 8  # steps ahead in the direction of scrubbing or playback
+
+
+class FrameCache:
+    """LRU cache of frames [t, z, c] of a datastore, limited to budget bytes.
+
+    prefetch hands a list of keys to a background thread that loads the ones that are not cached
+    yet. A new call replaces the keys that were not loaded yet, so the thread always works on the
+    latest position and direction of the slider. Frames are copies, a frame that changes in the
+    datastore has to be invalidated. Invalidation counts per key, a load that started before the
+    latest invalidation of its key is not cached, so an old frame can not come back.
+    """
+    def __init__(self, datastore, budget: int = CACHE_BUDGET):
+        self.datastore = datastore
+        self.budget = budget
+        self.frames = OrderedDict()
+        self.nbytes = 0
+        self._generations = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._pending = []
+        self._running = True
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self._thread.start()
+
+    def get(self, key) -> np.ndarray:
+        key = tuple(key)
+        with self._condition:
+            if key in self.frames:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return self.frames[key]
+            self.misses += 1
+        return self._load(key)
+
+    def __contains__(self, key) -> bool:
+        return tuple(key) in self.frames
+
+    def _generation_of(self, key: tuple) -> tuple:
+        return self._generation, self._generations.get(key, 0)
+
+    def _load(self, key: tuple) -> np.ndarray:
+        with self._condition:
+            generation = self._generation_of(key)
+        frame = np.array(self.datastore.get_frame(list(key)))
+        with self._condition:
+            if self._generation_of(key) != generation:
+                # Invalidated while it was loading, the frame might be outdated
+                return frame
+            if key in self.frames:
+                self.nbytes -= self.frames.pop(key).nbytes
+            self.frames[key] = frame
+            self.nbytes += frame.nbytes
+            while self.nbytes > self.budget and len(self.frames) > 1:
+                self.nbytes -= self.frames.popitem(last=False)[1].nbytes
+        return frame
+
+    def prefetch(self, keys: list):
+        "Load keys in the background, in this order."
+        with self._condition:
+            self._pending = [tuple(key) for key in keys]
+            self._condition.notify()
+
+    def _prefetch_loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or not self._running)
+                if not self._running:
+                    return
+                key = self._pending.pop(0)
+                if key in self.frames:
+                    continue
+            try:
+                self._load(key)
+            except IndexError:
+                # Not acquired yet or already overwritten in the ring buffer
+                pass
+            except Exception:
+                log.exception(f"Failed to prefetch frame {key}")
+
+    def invalidate(self, key=None):
+        "Drop key from the cache, or everything if key is None."
+        with self._condition:
+            if key is None:
+                self.frames.clear()
+                self.nbytes = 0
+                self._pending = []
+                self._generations.clear()
+                self._generation += 1
+                return
+            key = tuple(key)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            if key in self.frames:
+                self.nbytes -= self.frames.pop(key).nbytes
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+
+
+def prefetch_keys(index: dict, axis: str, direction: int, sizes: dict, channels: int,
+                  depth: int = PREFETCH_DEPTH) -> list:
+    """Keys [t, z, c] of the next depth steps from index along axis in direction, for all
+    channels, as long as they are inside sizes."""
+    keys = []
+    for step in range(1, depth + 1):
+        position = dict(index)
+        position[axis] = index[axis] + direction*step
+        if not 0 <= position[axis] < max(sizes.get(axis, 1), 1):
+            break
+        keys += [(position["t"], position["z"], c) for c in range(channels)]
+    return keys
@@ -0,0 +1,334 @@
+from collections.abc import Mapping
+from enum import IntEnum
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import time
+import numpy as np
+
+DIMENSIONS = ["c", "z", "t", "p", "g"]
+HISTOGRAM_BINS = 64
+
+# Statistics of the pixels of a frame, see frame_stats
+STATS = [("min", np.float64),
+         ("max", np.float64),
+         ("mean", np.float64),
+         ("sum", np.float64),
+         ("histogram", np.uint32, (HISTOGRAM_BINS,)),
+         ("histogram_shift", np.uint8)]
+
+FRAME_RECORD = np.dtype([("index", np.int32, (len(DIMENSIONS),)),
+                         ("seq", np.uint64),
+                         ("generation", np.uint64),
+                         ("offset", np.uint64),
+                         ("shape", np.uint32, (2,)),
+                         *STATS])
+
+
+class FrameState(IntEnum):
+    "State of the data a record points to in a ring buffer."
+    VALID = 0
+    STALE = 1  # Still in the buffer, but the index has been acquired again since
+    EVICTED = 2  # Overwritten by newer frames
+
+
+def frame_state(record: np.void, written: int, capacity: int,
+                latest_seq: int|None = None) -> FrameState:
+    """State of a record given the number of elements written to a buffer of capacity. The
+    generation of a record counts how often the buffer had wrapped around when it was written."""
+    start = int(record["generation"])*capacity + int(record["offset"])
+    if written - start > capacity:
+        return FrameState.EVICTED
+    if latest_seq is not None and latest_seq != int(record["seq"]):
+        return FrameState.STALE
+    return FrameState.VALID
+
+
+def frame_stats(img: np.ndarray) -> dict:
+    """Min, max, mean, sum and a coarse histogram of img, to be computed once when the frame is
+    ingested and stored in its record. All of them are exact, taken from every pixel.
+
+    Integer images of up to 16 bit are scanned once, into a histogram with a bin per value. The
+    other statistics follow from that, and it is binned into HISTOGRAM_BINS bins of width
+    2**histogram_shift from 0, just wide enough for the maximum. Other images get no histogram.
+    """
+    stats = {"min": 0, "max": 0, "sum": 0., "mean": 0.,
+             "histogram": np.zeros(HISTOGRAM_BINS, np.uint32), "histogram_shift": 0}
+    if not img.size:
+        return stats
+    if img.dtype.kind == "u" and img.dtype.itemsize <= 2:
+        counts = np.bincount(img.ravel(), minlength=HISTOGRAM_BINS)
+        low, high = np.flatnonzero(counts)[[0, -1]]
+        total = float(counts @ np.arange(len(counts), dtype=np.float64))
+        shift = max(int(high).bit_length() - int(np.log2(HISTOGRAM_BINS)), 0)
+        counts = np.pad(counts, (0, (HISTOGRAM_BINS << shift) - len(counts)))
+        stats["histogram"] = counts.reshape(HISTOGRAM_BINS, -1).sum(axis=1)
+        stats["histogram_shift"] = shift
+    else:
+        low, high = img.min(), img.max()
+        total = float(img.sum(dtype=np.float64))
+    stats.update({"min": low, "max": high, "sum": total, "mean": total/img.size})
+    return stats
+
+
+def record_stats(record: np.void) -> dict:
+    "The statistics of a record as a dict, with the edges of the histogram bins."
+    stats = {name: record[name] for name, *_ in STATS}
+    stats["edges"] = np.arange(HISTOGRAM_BINS + 1) << int(record["histogram_shift"])
+    return stats
+
+
+def index_key(indeces) -> tuple:
+    """Normalise an MDAEvent index (dict) or a list ordered like DIMENSIONS to a full key.
+    Missing dimensions are 0."""
+    if isinstance(indeces, Mapping):
+        return tuple(int(indeces.get(dim, 0)) for dim in DIMENSIONS)
+    key = [int(i) for i in indeces]
+    if len(key) > len(DIMENSIONS):
+        raise IndexError(f"Index {key} has more than {len(DIMENSIONS)} dimensions")
+    return tuple(key + [0]*(len(DIMENSIONS) - len(key)))
+
+
+class FrameIndex:
+    """Index from the acquisition indices of a frame to its location in a buffer.
+
+    Records are appended to a structured array that doubles in size when full, a dict maps the
+    index key to the record. Only frames that were acquired take up space, so sparse, event
+    driven acquisitions stay small. If a frame is acquired again for the same index, the newest
+    record wins.
+    """
+    def __init__(self, capacity: int = 1024, dtype: np.dtype = FRAME_RECORD):
+        self.records = np.zeros(max(int(capacity), 1), dtype=dtype)
+        self.count = 0
+        self._lookup = {}
+
+    def add(self, indeces, **fields) -> int:
+        "Append a record for indeces and return its row in records."
+        if self.count == len(self.records):
+            self.records = np.resize(self.records, 2*len(self.records))
+        key = index_key(indeces)
+        row = self.count
+        record = self.records[row]
+        record["index"] = key
+        record["seq"] = row
+        for name, value in fields.items():
+            record[name] = value
+        self._lookup[key] = row
+        self.count += 1
+        return row
+
+    def row(self, indeces) -> int:
+        try:
+            return self._lookup[index_key(indeces)]
+        except KeyError:
+            raise IndexError(f"No frame for index {indeces}") from None
+
+    def __getitem__(self, indeces) -> np.void:
+        return self.records[self.row(indeces)]
+
+    def __contains__(self, indeces) -> bool:
+        return index_key(indeces) in self._lookup
+
+    def __len__(self) -> int:
+        return len(self._lookup)
+
+    def shape(self) -> tuple:
+        "Extent of the acquired indices along DIMENSIONS."
+        if not self.count:
+            return tuple(0 for _ in DIMENSIONS)
+        return tuple(int(x) + 1 for x in self.records["index"][:self.count].max(axis=0))
+
+
+SHARED_RECORD = np.dtype([("index", np.int32, (len(DIMENSIONS),)),
+                          ("seq", np.uint64),
+                          ("generation", np.uint64),
+                          ("offset", np.uint64),
+                          ("shape", np.uint32, (2,)),
+                          ("dtype", "S8"),
+                          ("timestamp", np.float64),
+                          *STATS])
+HEADER = ["count", "capacity", "table_size", "written", "saved", "cursors", "heartbeat"]
+EMPTY = -1
+WRITING = np.iinfo(np.uint64).max  # seq of a record while the writer changes it
+MAX_PROBE = 64  # slots of the table looked at for a key, the table is at most half full
+
+
+def _attach(name: str) -> SharedMemory:
+    "Attach to an existing segment without registering it, so it is not unlinked on our exit."
+    try:
+        return SharedMemory(name=name, create=False, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return SharedMemory(name=name, create=False)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedFrameIndex:
+    """Frame index published in shared memory, so that other processes can look up frames by
+    attaching to it by name.
+
+    There is a single writer. Records are kept in a ring of `capacity` entries addressed by their
+    sequence number, a hash table with open addressing maps the index key to the sequence
+    number. A record is only visible to readers after the count in the header has been
+    incremented. Entries whose record was overwritten are reused by later inserts, so the table
+    never fills up. A key is only looked for in MAX_PROBE slots, so a miss stays cheap.
+
+    While the writer changes a record, its seq is WRITING. A reader copies a record and only
+    uses the copy if seq was the same before and after, otherwise it looks the key up again.
+
+    The header also holds the number of elements written to the buffer so far. The writer
+    advances it before it overwrites data, a reader compares it to the generation and offset of a
+    record to know if the data it looked at is still intact, see frame_state.
+
+    A saver that registers a cursor publishes in saved up to which element everything is on
+    disk, the writer does not overwrite data after it, see BufferedDataStore.new_frame. The saver
+    also updates heartbeat (ms since the epoch) whenever it does something, so the writer can
+    tell a saver that is gone from one that is busy.
+    """
+    def __init__(self, name: str|None = None, create: bool = True, capacity: int = 2**17):
+        if create:
+            table_size = 2*capacity
+            size = (len(HEADER)*8 + capacity*SHARED_RECORD.itemsize + table_size*8)
+            self._shm = SharedMemory(name=name, create=True, size=size)
+        else:
+            self._shm = _attach(name)
+        self.owner = create
+        self.name = self._shm.name
+        self.header = np.ndarray(len(HEADER), np.uint64, buffer=self._shm.buf)
+        if create:
+            self.header[:] = [0, capacity, table_size, 0, 0, 0, 0]
+        self.capacity, self.table_size = (int(x) for x in self.header[1:3])
+        offset = self.header.nbytes
+        self.records = np.ndarray(self.capacity, SHARED_RECORD, buffer=self._shm.buf,
+                                  offset=offset)
+        offset += self.records.nbytes
+        self.table = np.ndarray(self.table_size, np.int64, buffer=self._shm.buf, offset=offset)
+        if create:
+            self.table[:] = EMPTY
+
+    @property
+    def count(self) -> int:
+        "Number of records published so far."
+        return int(self.header[0])
+
+    @property
+    def written(self) -> int:
+        "Number of elements written to the buffer, including the ones about to be written."
+        return int(self.header[3])
+
+    @written.setter
+    def written(self, value: int):
+        self.header[3] = value
+
+    @property
+    def saved(self) -> int|None:
+        "Number of elements a saver has on disk, None if there is no saver."
+        return int(self.header[4]) if self.header[5] else None
+
+    @saved.setter
+    def saved(self, value: int):
+        self.header[4] = value
+
+    def register_cursor(self):
+        "Make the writer respect saved, starting from the data that is in the buffer now."
+        self.header[4] = self.header[3]
+        self.beat()
+        self.header[5] = 1
+
+    def unregister_cursor(self):
+        self.header[5] = 0
+
+    def beat(self):
+        "Tell the writer that the saver is alive."
+        self.header[6] = int(time.time()*1000)
+
+    @property
+    def heartbeat_age(self) -> float:
+        "Seconds since the saver was last seen alive."
+        return time.time() - int(self.header[6])/1000
+
+    def add(self, indeces, offset: int, generation: int, shape: tuple, dtype: np.dtype,
+            timestamp: float, stats: dict|None = None) -> int:
+        "Publish a record for indeces and return its sequence number. stats are frame_stats."
+        key = index_key(indeces)
+        seq = self.count
+        record = self.records[seq % self.capacity]
+        record["seq"] = WRITING
+        record["index"] = key
+        record["offset"] = offset
+        record["generation"] = generation
+        record["shape"] = shape
+        record["dtype"] = np.dtype(dtype).str
+        record["timestamp"] = timestamp
+        for name, value in (stats or {}).items():
+            record[name] = value
+        record["seq"] = seq
+        slots = list(self._probe(key))
+        for slot in slots:
+            entry = int(self.table[slot])
+            if entry == EMPTY or not self._live(entry, seq + 1) or self._key(entry) == key:
+                break
+        else:
+            # All slots are taken by live records, drop the oldest of them from the index
+            slot = min(slots, key=lambda slot: int(self.table[slot]))
+        self.table[slot] = seq
+        self.header[0] = seq + 1
+        return seq
+
+    def __getitem__(self, indeces) -> np.void:
+        key = index_key(indeces)
+        while True:
+            count = self.count
+            torn = False
+            for slot in self._probe(key):
+                entry = int(self.table[slot])
+                if entry == EMPTY:
+                    break
+                if not self._live(entry, count) or self._key(entry) != key:
+                    continue
+                record = self._read(entry)
+                if record is not None and index_key(record["index"]) == key:
+                    return record
+                torn = True
+            if not torn or self.count == count:
+                raise IndexError(f"No frame for index {indeces}")
+
+    def _read(self, seq: int) -> np.void|None:
+        "Copy of the record seq, None if it was being overwritten."
+        record = self.records[seq % self.capacity]
+        if int(record["seq"]) != seq:
+            return None
+        copy = record.copy()
+        if int(record["seq"]) != seq or int(copy["seq"]) != seq:
+            return None
+        return copy
+
+    def __contains__(self, indeces) -> bool:
+        try:
+            self[indeces]
+        except IndexError:
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def _probe(self, key: tuple):
+        start = hash(key) % self.table_size
+        for i in range(min(MAX_PROBE, self.table_size)):
+            yield (start + i) % self.table_size
+
+    def _live(self, seq: int, count: int) -> bool:
+        return count - self.capacity <= seq < count
+
+    def _key(self, seq: int) -> tuple:
+        return tuple(int(x) for x in self.records[seq % self.capacity]["index"])
+
+    def close(self):
+        del self.header, self.records, self.table
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
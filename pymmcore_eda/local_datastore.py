@@ -1,110 +1,253 @@
 from qtpy import QtCore
 import numpy as np
 import numpy.typing as npt
-from pymmcore_eda.buffered_datastore import complement_indices
-from useq import MDAEvent
+from pymmcore_eda.buffered_datastore import FrameOverwrittenError, complement_indices
+from useq import MDAEvent, MDASequence
 from pymmcore_plus import CMMCorePlus
 from pymmcore_eda.event_receiver import QEventReceiver, QEventConsumer
 from pymmcore_eda.buffered_datastore import BufferedDataStore
+from pymmcore_eda.chunked_array import ChunkedArray, MappedArray
+from pymmcore_eda.frame_index import frame_stats
+from pymmcore_eda.codec import FrameEvent
+from pathlib import Path
+import os
+import queue
+import time
 
 from logging import getLogger
-from copy import deepcopy
 
 log = getLogger(__name__)
 
 mmcore = CMMCorePlus.instance()
 mmcore.loadSystemConfiguration()
 
+AXES = ["t", "z", "c"]
+INGEST_QUEUE_SIZE = 64  # frames QLocalDataStore buffers before the acquisition has to wait
+CHUNK_SIZE = 8  # timepoints per chunk for sequences that don't know their length
+
 class QDataStore(QEventConsumer):
     """Datastore that receives events from the eventreiceiver from a BufferedDataStore from a
     different process. It copies it into a numpy array, emits a signal when it's ready to be
-    displayed."""
-    frame_ready = QtCore.Signal(MDAEvent)
+    displayed. Frame locations are looked up in the shared index of the remote datastore, the
+    event only tells which frame arrived. With zero_copy, frames are not copied at all and
+    get_frame reads directly from the shared memory.
+    The array is sized for each sequence at its first frame, see preallocate."""
+    frame_ready = QtCore.Signal(object)
 
     def __init__(self, event_receiver: QEventReceiver, remote_datastore_name: BufferedDataStore,
-                 shape: tuple, dtype: npt.DTypeLike = np.int16, *args, **kwargs):
+                 shape: tuple, dtype: npt.DTypeLike = np.int16, *args, zero_copy: bool = False,
+                 **kwargs):
         super().__init__(event_receiver, *args, **kwargs)
         self.dtype = np.dtype(dtype)
-        self.array = np.ndarray(shape, dtype=self.dtype, *args, **kwargs)
+        self.zero_copy = zero_copy
+        if not self.zero_copy:
+            self.array = np.ndarray(shape, dtype=self.dtype, *args, **kwargs)
+        self.sequence = None
 
+        self.events.sequence_started.connect(self.on_sequence_start)
         self.listener.frame_ready.connect(self.new_frame)
         self.remote_datastore = BufferedDataStore(name=remote_datastore_name, create=False)
         setattr(self, "complement_indices", complement_indices)
-        # setattr(self, "correct_shape", correct_shape)
+        self.correct_shape = correct_shape
+        self.preallocate = preallocate
+
+    def on_sequence_start(self, sequence: MDASequence):
+        self.sequence = sequence
 
     def new_frame(self, event: MDAEvent, shape: tuple, index: int):
-        print("NEW FRAME IN LOCAL STORE", event.index)
+        """Copy the frame of event from the remote datastore, with zero_copy only check that it
+        is still there. A frame that was overwritten in the ring buffer before it got here is
+        dropped."""
+        try:
+            frame = self.remote_datastore.get_frame(event.index)
+        except FrameOverwrittenError:
+            log.warning(f"Frame {event.index} was overwritten before it was received, dropped")
+            return
+        if self.zero_copy:
+            self.frame_ready.emit(event)
+            return
         indices = self.complement_indices(event)
         id_list = [indices["t"], indices["z"], indices["c"]]
+        if self.sequence is not None:
+            self.preallocate(self, self.sequence, frame.shape)
+            self.sequence = None
         try:
-            index1 = index + shape[0]*shape[1]
-            self.array[*id_list, :, :] = deepcopy(np.reshape(self.remote_datastore[index:index1],
-                                                             [shape[0], shape[1]]))
+            self.array[*id_list, :, :] = frame
         except IndexError:
             self.correct_shape(self, indices)
-            self.new_frame(event)
-            return
+            self.array[*id_list, :, :] = frame
         self.frame_ready.emit(event)
 
     def get_frame(self, key):
+        """Frame at key [t, z, c]. With zero_copy this is a read-only view into the shared memory
+        of the remote datastore, raises FrameOverwrittenError if the frame is not in the ring
+        buffer anymore."""
+        if self.zero_copy:
+            return self.remote_datastore.get_frame(dict(zip(["t", "z", "c"], key)))
         return self.array[*key, :, :]
 
-def correct_shape(self, indices: tuple) -> None:
-    "The initialised shape does not fit the data, extend the array."
-    min_shape = [indices["t"], indices["z"], indices["c"]]
-    diff = [x - y for x, y in zip(min_shape, self.array.shape[:-2])]
-    for i, app in enumerate(diff):
-        if app >= 0:
-            if i == 2: # handle time differently, double the size
-                app = self.array.shape[0]
-            append_shape = [*self.array.shape[:i], app + 1, *self.array.shape[i:]]
-            self.array = np.append(self.array, np.zeros(append_shape, self.array.dtype),
-                                    axis=i)
-            print("new shape", self.array.shape)
+    def get_stats(self, key) -> dict:
+        "Statistics of the frame at key [t, z, c] from the shared index of the remote datastore."
+        return self.remote_datastore.get_stats(dict(zip(["t", "z", "c"], key)))
+
+def shape_from_sequence(sequence: MDASequence, frame_shape: tuple) -> list:
+    "Shape [t, z, c, *frame_shape] of the data of sequence, axes it doesn't have are 1 long."
+    return [max(sequence.sizes.get(dim, 0), 1) for dim in AXES] + list(frame_shape)
+
+
+def preallocate(self, sequence: MDASequence, frame_shape: tuple) -> None:
+    """Size the array for sequence. If the current allocation is big enough, the array becomes a
+    view into it instead of allocating a new one. Sequences that don't know how many timepoints
+    they have, like event driven ones with fixed channels and z, get a ChunkedArray, that grows
+    in chunks of CHUNK_SIZE timepoints. If self has a path, the data of each sequence goes to a
+    MappedArray in a raw file named after the sequence uid instead."""
+    shape = shape_from_sequence(sequence, frame_shape)
+    open_ended = not sequence.sizes.get("t", 0)
+    if isinstance(self.array, MappedArray):
+        self.array.close()
+    if getattr(self, "path", None) is not None:
+        self.array = MappedArray(Path(self.path)/f"{sequence.uid}.raw", shape, self.dtype,
+                                 chunk_size=CHUNK_SIZE if open_ended else shape[0])
+        log.info(f"Mapped {self.array.shape} for sequence to {self.array.path}")
+        return
+    if open_ended:
+        self.array = ChunkedArray(shape, self.dtype, chunk_size=CHUNK_SIZE)
+        log.info(f"Allocated chunks of {self.array.chunk_shape} for open-ended sequence")
+        return
+    allocation = getattr(self, "_allocation", self.array)
+    if (isinstance(allocation, np.ndarray) and allocation.ndim == len(shape) and allocation.dtype == self.dtype
+            and all(x >= y for x, y in zip(allocation.shape, shape))):
+        self.array = allocation[tuple(slice(0, x) for x in shape)]
+        self.array[:] = 0
+    else:
+        self.array = np.zeros(shape, self.dtype)
+        self._allocation = self.array
+    log.info(f"Allocated {self.array.shape} for sequence")
+
+
+def correct_shape(self, indices: dict) -> None:
+    """The data doesn't fit into the array, this only happens for sequences that don't know
+    their size. Time grows geometrically, everything is copied once. A ChunkedArray only
+    copies when z or c grow."""
+    shape = list(self.array.shape)
+    for i, dim in enumerate(AXES):
+        if indices[dim] >= shape[i]:
+            shape[i] = max(indices[dim] + 1, 2*shape[i]) if dim == "t" else indices[dim] + 1
+    if isinstance(self.array, ChunkedArray):
+        self.array.grow(shape)
+        log.info(f"new shape {self.array.shape}")
+        return
+    array = np.zeros(shape, self.array.dtype)
+    array[tuple(slice(0, x) for x in self.array.shape)] = self.array
+    self.array = array
+    self._allocation = self.array
+    log.info(f"new shape {self.array.shape}")
 
 
 class QLocalDataStore(QtCore.QObject):
     """DataStore that connects directly to the mmcore frameReady event and saves the data for
-    a consumer like Canvas to show it."""
-    frame_ready = QtCore.Signal(MDAEvent)
+    a consumer like Canvas to show it. The array is sized for each sequence at its first frame,
+    see preallocate.
+    With a path, the frames are not kept in RAM but in memory mapped raw files in that directory,
+    one per sequence, that stay on disk as the dump of the run.
+    sequence_started and sequence_finished are emitted from the ingest thread, in order with
+    frame_ready, so a consumer sees all frames of a sequence between them."""
+    frame_ready = QtCore.Signal(object)
+    sequence_started = QtCore.Signal(MDASequence)
+    sequence_finished = QtCore.Signal(MDASequence)
     def __init__(self, shape: tuple, dtype: npt.DTypeLike = np.uint16, *args,
-                 correct_shape = correct_shape, **kwargs):
+                 correct_shape = correct_shape, path: str|os.PathLike|None = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.dtype = np.dtype(dtype)
+        self.path = path
         self.array = np.ndarray(shape, dtype=self.dtype, *args, **kwargs)
         self.correct_shape = correct_shape
+        self.preallocate = preallocate
+        self.sequence = None
+        self.stats = {}
         setattr(self, "complement_indices", complement_indices)
 
-        self.listener = self.EventListener()
+        self.listener = self.EventListener(self)
         self.listener.start()
-        self.listener.frame_ready.connect(self.new_frame)
 
 
     class EventListener(QtCore.QThread):
-        "Receive events in a separate thread"
-        frame_ready = QtCore.Signal(np.ndarray, MDAEvent)
-        def __init__(self):
+        """Ingests the events in a separate thread. The mmcore callbacks only put the events into
+        a bounded queue, the copy into the array happens in run. If the thread falls
+        INGEST_QUEUE_SIZE events behind, the acquisition waits for it. The start and end of a
+        sequence go through the same queue, so they keep their order with the frames."""
+        def __init__(self, datastore: "QLocalDataStore", maxsize: int = INGEST_QUEUE_SIZE):
             super().__init__()
+            self.datastore = datastore
+            self.queue = queue.Queue(maxsize)
+            mmcore.mda.events.sequenceStarted.connect(self.on_sequence_start)
             mmcore.mda.events.frameReady.connect(self.on_frame_ready)
+            mmcore.mda.events.sequenceFinished.connect(self.on_sequence_finish)
 
-        def on_frame_ready(self, img: np.ndarray, event: MDAEvent):
-            self.frame_ready.emit(img, event)
+        def on_sequence_start(self, sequence: MDASequence):
+            self.queue.put((self.datastore.on_sequence_start, (sequence,)))
 
-        def closeEvent(self, event):
-            super().exit()
-            event.accept()
+        def on_sequence_finish(self, sequence: MDASequence):
+            self.queue.put((self.datastore.on_sequence_finish, (sequence,)))
 
-    def new_frame(self, img: np.ndarray, event: MDAEvent):
+        def on_frame_ready(self, img: np.ndarray, event: MDAEvent):
+            # Called on the acquisition thread, this is when the frame was acquired
+            self.queue.put((self.datastore.new_frame, (img, event, time.time())))
+
+        def run(self):
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                callback, args = item
+                try:
+                    callback(*args)
+                except Exception:
+                    log.exception(f"Failed to ingest {args[-1]}")
+
+        def stop(self):
+            mmcore.mda.events.sequenceStarted.disconnect(self.on_sequence_start)
+            mmcore.mda.events.frameReady.disconnect(self.on_frame_ready)
+            mmcore.mda.events.sequenceFinished.disconnect(self.on_sequence_finish)
+            self.queue.put(None)
+            self.wait()
+
+        def closeEvent(self, event=None):
+            self.stop()
+            if event is not None:
+                event.accept()
+
+    def on_sequence_start(self, sequence: MDASequence):
+        self.sequence = sequence
+        self.stats = {}
+        self.sequence_started.emit(sequence)
+
+    def on_sequence_finish(self, sequence: MDASequence):
+        self.sequence_finished.emit(sequence)
+
+    def new_frame(self, img: np.ndarray, event: MDAEvent, timestamp: float|None = None):
+        """Called in the EventListener thread. Stores img and its frame_stats, the frame_ready signal
+        only tells the consumers which frame is available, with a FrameEvent that carries the
+        time it was acquired."""
         self.shape = img.shape
         indices = self.complement_indices(event)
         img = img*(indices["t"] + 1)//10
+        if self.sequence is not None:
+            self.preallocate(self, self.sequence, img.shape)
+            self.sequence = None
         try:
             self.array[indices["t"], indices["z"], indices["c"], :, :] = img
         except IndexError:
             self.correct_shape(self, indices)
-            self.new_frame(img, event)
-            return
-        self.frame_ready.emit(event)
+            self.array[indices["t"], indices["z"], indices["c"], :, :] = img
+        self.stats[(indices["t"], indices["z"], indices["c"])] = frame_stats(img)
+        uid = event.sequence.uid if event.sequence is not None else None
+        self.frame_ready.emit(FrameEvent(event.index, sequence_uid=uid, timestamp=timestamp,
+                                         event=event))
 
     def get_frame(self, key):
         return self.array[ *key, :, :]
+
+    def get_stats(self, key) -> dict:
+        "frame_stats of the frame at key [t, z, c], computed at ingest."
+        return self.stats[tuple(key)]
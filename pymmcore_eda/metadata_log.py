@@ -0,0 +1,112 @@
+from pathlib import Path
+import json
+import os
+import time
+import numpy as np
+from useq import MDAEvent
+
+from pymmcore_eda.frame_index import DIMENSIONS
+
+# One record per frame, a column per field. Positions and exposure are NaN if the event has none
+METADATA_RECORD = np.dtype([("frame", np.uint64),
+                            *[(dim, np.int32) for dim in ["t", "z", "c", "p", "g"]],
+                            ("exposure", np.float64),
+                            ("x_pos", np.float64),
+                            ("y_pos", np.float64),
+                            ("z_pos", np.float64),
+                            ("min_start_time", np.float64),
+                            ("timestamp", np.float64)])
+
+
+def event_record(event: MDAEvent, frame: int = 0, timestamp: float|None = None) -> np.ndarray:
+    """Record of the metadata of event. timestamp is the time it was acquired, by default the
+    one the event carries, like a FrameEvent does, otherwise now."""
+    if timestamp is None:
+        timestamp = getattr(event, "timestamp", None)
+    record = np.zeros((), METADATA_RECORD)
+    record["frame"] = frame
+    for dim in DIMENSIONS:
+        record[dim] = event.index.get(dim, 0)
+    for field in ["exposure", "x_pos", "y_pos", "z_pos", "min_start_time"]:
+        value = getattr(event, field)
+        record[field] = np.nan if value is None else value
+    record["timestamp"] = time.time() if timestamp is None else timestamp
+    return record
+
+
+class MetadataLog:
+    """Per-frame metadata appended to a raw file of METADATA_RECORDs at path, with a JSON sidecar
+    that describes the records like the one of a MappedArray. The records are only a few dozen
+    bytes each, so the log can be read as a memmap and queried without touching the frames.
+    A log that was not closed is still readable, its length follows from the file size.
+    """
+    def __init__(self, path: str|os.PathLike):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "wb")
+        self.count = 0
+        self._write_sidecar()
+
+    def append(self, record):
+        "Append a record, an event is converted with event_record."
+        if not isinstance(record, np.ndarray):
+            record = event_record(record, frame=self.count)
+        self.file.write(np.asarray(record, METADATA_RECORD).tobytes())
+        self.count += 1
+
+    def extend(self, records: np.ndarray):
+        records = np.asarray(records, METADATA_RECORD)
+        self.file.write(records.tobytes())
+        self.count += records.size
+
+    def _write_sidecar(self):
+        sidecar = sidecar_path(self.path)
+        temp_path = sidecar.with_suffix(".tmp")
+        temp_path.write_text(json.dumps({"count": self.count,
+                                         "dtype": np.lib.format.dtype_to_descr(METADATA_RECORD)}))
+        os.replace(temp_path, sidecar)
+
+    def read(self) -> np.ndarray:
+        "The records written so far as a memmap."
+        self.flush()
+        return load_log(self.path)
+
+    def flush(self):
+        self.file.flush()
+        self._write_sidecar()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+
+
+def sidecar_path(path: str|os.PathLike) -> Path:
+    path = Path(path)
+    return path.with_suffix(path.suffix + ".json")
+
+
+def load_log(path: str|os.PathLike) -> np.ndarray:
+    "Open the records of a MetadataLog as a structured memmap."
+    dtype = METADATA_RECORD
+    if sidecar_path(path).exists():
+        # JSON turns the (name, type) tuples of the descr into lists
+        descr = json.loads(sidecar_path(path).read_text())["dtype"]
+        dtype = np.lib.format.descr_to_dtype([tuple(field) for field in descr])
+    count = os.path.getsize(path)//dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype, mode="r", shape=(count,))
+
+
+def query(records: np.ndarray, **conditions) -> np.ndarray:
+    """Positions of the records that match all conditions, a value or a function of the column
+    that returns a mask, e.g. query(records, c=1, t=lambda t: t > 500). The records are stored
+    one after the other, so a column is a strided view that reads through whole records, but
+    those are only a few dozen bytes and no pixels are touched."""
+    mask = np.ones(len(records), bool)
+    for field, condition in conditions.items():
+        column = records[field]
+        mask &= condition(column) if callable(condition) else column == condition
+    return np.flatnonzero(mask)
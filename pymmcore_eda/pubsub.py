@@ -0,0 +1,225 @@
+from collections import deque
+from logging import getLogger
+from multiprocessing.connection import Client, Listener
+from queue import Empty
+import json
+import pickle
+import threading
+from pymmcore_eda.codec import FRAME_READY_TAG
+
+log = getLogger(__name__)
+
+TOPICS = ("sequence_started", "frame_ready", "sequence_finished", "stop")
+POLICIES = ("drop_oldest", "drop_newest", "disconnect", "block")
+RAW, PICKLED = b"\0", b"\1"
+HANDSHAKE_TIMEOUT = 5  # s a new subscriber has to send its settings
+MAX_SETTINGS_SIZE = 4096  # bytes
+
+
+def topic_of(message: dict|bytes) -> str:
+    "Topic of a message encoded by one of the codecs."
+    if isinstance(message, bytes):
+        if message[0] == FRAME_READY_TAG:
+            return "frame_ready"
+        raise ValueError(f"Unknown message tag {message[0]}")
+    return message["name"]
+
+
+class Subscription:
+    """Connection of the EventPublisher to one subscriber, with its own send buffer and thread.
+    When the buffer is full, policy decides what happens: drop the oldest or the newest message,
+    disconnect the subscriber or block the publisher until there is space."""
+
+    def __init__(self, connection, topics: list[str], buffer_size: int = 1024,
+                 policy: str = "drop_oldest"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy}, use one of {POLICIES}")
+        self.connection = connection
+        self.topics = set(topics)
+        self.buffer_size = buffer_size
+        self.policy = policy
+        self.buffer = deque()
+        self.dropped = 0
+        self.sent = 0
+        self.closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._send_loop, daemon=True)
+        self._thread.start()
+
+    def enqueue(self, message: dict|bytes):
+        with self._condition:
+            if len(self.buffer) >= self.buffer_size:
+                match self.policy:
+                    case "drop_oldest":
+                        self.buffer.popleft()
+                        self.dropped += 1
+                    case "drop_newest":
+                        self.dropped += 1
+                        return
+                    case "disconnect":
+                        self.close()
+                        return
+                    case "block":
+                        self._condition.wait_for(lambda: len(self.buffer) < self.buffer_size
+                                                 or self.closed)
+            if self.closed:
+                return
+            self.buffer.append(message)
+            self._condition.notify_all()
+
+    def _send_loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.buffer or self.closed)
+                if self.closed:
+                    return
+                message = self.buffer.popleft()
+                self._condition.notify_all()
+            if isinstance(message, bytes):
+                data = RAW + message
+            else:
+                data = PICKLED + pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+            try:
+                self.connection.send_bytes(data)
+            except OSError:
+                self.close()
+                return
+            self.sent += 1
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        self.connection.close()
+
+
+class EventPublisher:
+    """Local server that fans out the events of one EventSender to any number of subscribers in
+    other processes, over Unix domain sockets (named pipes on Windows). Pass it to an
+    EventSender as event_queue and hand address to the EventSubscribers.
+
+    Every subscriber gets its own Subscription, so a slow subscriber never holds up the others or
+    the acquisition, unless it asked for the block policy.
+    """
+    def __init__(self, address: str|None = None, buffer_size: int = 1024,
+                 policy: str = "drop_oldest"):
+        self.buffer_size = buffer_size
+        self.policy = policy
+        self.subscriptions = {topic: set() for topic in TOPICS}
+        self._lock = threading.Lock()
+        self._listener = Listener(address)
+        self.address = self._listener.address
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except (OSError, EOFError):
+                return
+            threading.Thread(target=self._handshake, args=(connection,), daemon=True).start()
+
+    def _settings(self, settings) -> tuple[list[str], int, str]:
+        """Topics, buffer size and policy from the settings a subscriber sent, with the defaults
+        of the publisher for the ones it left out. Raises ValueError for anything invalid."""
+        if not isinstance(settings, dict):
+            raise ValueError("settings are not an object")
+        topics = settings.get("topics")
+        if not isinstance(topics, list) or not all(isinstance(topic, str) for topic in topics):
+            raise ValueError(f"topics {topics!r} are not a list of strings")
+        buffer_size = settings.get("buffer_size")
+        if buffer_size is None:
+            buffer_size = self.buffer_size
+        elif type(buffer_size) is not int or buffer_size < 1:
+            raise ValueError(f"buffer_size {buffer_size!r} is not a positive integer")
+        policy = settings.get("policy")
+        if policy is None:
+            policy = self.policy
+        elif policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, use one of {POLICIES}")
+        return topics, buffer_size, policy
+
+    def _handshake(self, connection):
+        """Register a new subscriber with the settings it sends as JSON. Invalid settings are
+        answered with an error, they and nothing within HANDSHAKE_TIMEOUT close the connection.
+        Nothing from a subscriber is unpickled, so any local process can connect without being
+        able to run code in ours."""
+        try:
+            if not connection.poll(HANDSHAKE_TIMEOUT):
+                raise TimeoutError("no settings received")
+            settings = json.loads(connection.recv_bytes(MAX_SETTINGS_SIZE))
+            subscription = Subscription(connection, *self._settings(settings))
+        except (OSError, EOFError, TimeoutError, ValueError) as e:
+            log.warning(f"Rejected subscriber: {e}")
+            try:
+                connection.send_bytes(f"error: {e}".encode())
+            except OSError:
+                pass
+            connection.close()
+            return
+        with self._lock:
+            for topic in subscription.topics:
+                self.subscriptions.setdefault(topic, set()).add(subscription)
+        connection.send_bytes(b"subscribed")
+
+    def publish(self, topic: str, message: dict|bytes):
+        with self._lock:
+            subscriptions = list(self.subscriptions.get(topic, ()))
+        for subscription in subscriptions:
+            if subscription.closed:
+                self._remove(subscription)
+            else:
+                subscription.enqueue(message)
+
+    def put(self, message: dict|bytes):
+        "Queue interface for the EventSender."
+        self.publish(topic_of(message), message)
+
+    def _remove(self, subscription: Subscription):
+        with self._lock:
+            for subscriptions in self.subscriptions.values():
+                subscriptions.discard(subscription)
+
+    def close(self):
+        self._listener.close()
+        with self._lock:
+            subscriptions = set().union(*self.subscriptions.values())
+            for topic in self.subscriptions:
+                self.subscriptions[topic] = set()
+        for subscription in subscriptions:
+            subscription.close()
+
+
+class EventSubscriber:
+    """Subscribes to topics of an EventPublisher at address. Has the get interface of a
+    multiprocessing.Queue, so it can be passed to a QEventReceiver. buffer_size and policy
+    override the settings of the publisher for this subscriber."""
+    def __init__(self, address: str, topics: list[str] = TOPICS, buffer_size: int|None = None,
+                 policy: str|None = None):
+        self._reader = Client(address)
+        self._reader.send_bytes(json.dumps({"topics": list(topics), "buffer_size": buffer_size,
+                                            "policy": policy}).encode())
+        # Wait until the publisher has registered us, so no message is missed after this
+        reply = self._reader.recv_bytes()
+        if reply != b"subscribed":
+            self._reader.close()
+            raise ConnectionError(f"Publisher rejected the subscription, {reply.decode()}")
+
+    def get(self, block: bool = True, timeout: float|None = None) -> dict|bytes:
+        if not self._reader.poll(timeout if block else 0):
+            raise Empty
+        try:
+            data = self._reader.recv_bytes()
+        except EOFError:
+            return {"name": "stop"}
+        return data[1:] if data[:1] == RAW else pickle.loads(data[1:])
+
+    def get_nowait(self) -> dict|bytes:
+        return self.get(block=False)
+
+    def empty(self) -> bool:
+        return not self._reader.poll(0)
+
+    def close(self):
+        self._reader.close()
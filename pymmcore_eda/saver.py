@@ -1,31 +1,183 @@
 from qtpy import QtWidgets, QtCore
-from useq import MDASequence
+from useq import MDASequence, MDAEvent
 from pymmcore_eda.event_receiver import QEventConsumer, QEventReceiver
-from pymmcore_eda.buffered_datastore import BufferedDataStore
+from pymmcore_eda.buffered_datastore import (BufferedDataStore, FrameOverwrittenError, SaveCursor,
+                                             complement_indices)
+from pymmcore_eda.zarr_writer import ZarrWriter
+from pymmcore_eda.tiff_writer import TiffWriter
+from pymmcore_eda.metadata_log import MetadataLog, event_record
+from pymmcore_eda.codec import FrameEvent
 from pathlib import Path
 import tifffile
+import threading
+import queue
+import time
 import os
 import numpy as np
+from logging import getLogger
 
 from pymmcore_plus import CMMCorePlus
+
+log = getLogger(__name__)
 mmcore = CMMCorePlus.instance()
 mmcore.loadSystemConfiguration()
 
+# Writers for streaming and the extension of the stores they write
+WRITERS = {"zarr": (ZarrWriter, ".ome.zarr"), "tiff": (TiffWriter, ".ome.tif")}
+
+
+def sequence_uid(event):
+    "Uid of the sequence of event, None if it does not know. Does not rebuild a FrameEvent."
+    if isinstance(event, FrameEvent):
+        return event.sequence_uid
+    return event.sequence.uid if event.sequence is not None else None
+
+
 class Saver(QEventConsumer):
-    """Save the array"""
+    """Save the array. With streaming, every frame is written to a store in save_location as it
+    arrives instead, one store per sequence that is finalized when the sequence finishes.
+    Frames go to the store of their own sequence, so a frame that arrives late never ends up in
+    the store of the next one. Frames are copied before they are handed to the writer, the
+    datastore reuses its array for the next sequence.
+    For a QDataStore with zero_copy, frames are written straight from the shared memory of the
+    remote datastore, a SaveCursor keeps it from overwriting frames before they are saved.
+    compression ("zlib", "zstd" or "lz4") compresses the chunks of a zarr store.
+    The metadata of every frame is kept in a MetadataLog next to the images.
+    The writers are fed and closed by a worker thread, so a disk that is slower than the
+    acquisition holds up the worker and not the GUI. stream_closed is emitted with the path of a
+    store once it is finalized."""
+    stream_closed = QtCore.Signal(str)
+
     def __init__(self, event_receiver: QEventReceiver|None = None, *args,
-                 datastore=None, **kwargs):
+                 datastore=None, streaming: str|None = None, compression: str|None = None,
+                 **kwargs):
         super().__init__(event_receiver, datastore=datastore, *args, **kwargs)
+        if streaming is not None and streaming not in WRITERS:
+            raise ValueError(f"Unknown streaming format {streaming}, use one of {list(WRITERS)}")
+        if compression is not None and streaming != "zarr":
+            raise ValueError("Compression is only supported when streaming to zarr")
         self.settings = QtCore.QSettings("MM", self.__class__.__name__)
 
         self.layout = QtWidgets.QHBoxLayout(self)
         self.save_button = QtWidgets.QPushButton("Save")
         self.save_button.clicked.connect(self.save_to_location)
         self.layout.addWidget(self.save_button)
+        self.status = QtWidgets.QLabel()
+        self.layout.addWidget(self.status)
         self.catch_next_idx = False
 
         self.save_location = self.settings.value("save_location", "C:\\")
 
+        self.streaming = streaming
+        self.compression = compression
+        # sequence uid -> (writer, metadata log) of the sequences that have not finished yet
+        self.streams = {}
+        self.writer = None
+        self.metadata_log = None
+        self.records = []
+        self.cursor = None
+        if streaming is not None and getattr(datastore, "zero_copy", False):
+            self.cursor = SaveCursor(datastore.remote_datastore)
+        # Calls to the writers, in the order the frames and sequence ends arrive
+        self.tasks = queue.Queue()
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+        self.events.sequence_started.connect(self.on_sequence_start)
+        self.events.frame_ready.connect(self.on_frame_ready)
+        if streaming is not None:
+            self.events.sequence_finished.connect(self.on_sequence_finish)
+            self.status_timer = QtCore.QTimer(interval=1000)
+            self.status_timer.timeout.connect(self.on_status_timer)
+            self.status_timer.start()
+
+    def on_sequence_start(self, sequence: MDASequence):
+        self.records = []
+        if self.streaming is None:
+            return
+        writer, extension = WRITERS[self.streaming]
+        name = f"{time.strftime('%Y%m%d_%H%M%S')}_{str(sequence.uid)[:8]}"
+        options = {"compression": self.compression} if self.compression else {}
+        self.writer = writer(Path(self.save_location)/f"{name}{extension}", **options)
+        self.writer.start(sequence)
+        self.metadata_log = MetadataLog(Path(self.save_location)/f"{name}.frames.bin")
+        self.streams[sequence.uid] = (self.writer, self.metadata_log)
+
+    def on_frame_ready(self, event: MDAEvent):
+        if self.streaming is None:
+            self.records.append(event_record(event, frame=len(self.records)))
+            return
+        uid = sequence_uid(event)
+        if uid is None:
+            # The remote side did not send the sequence, the frame belongs to the latest one
+            uid = next(reversed(self.streams), None)
+        if uid not in self.streams:
+            log.warning(f"Frame {event.index} arrived after its sequence finished, not saved")
+            return
+        writer, metadata_log = self.streams[uid]
+        indices = complement_indices(event)
+        key = (indices["t"], indices["z"], indices["c"])
+        if self.cursor is not None:
+            try:
+                frame, done, failed = self.cursor.add(event.index)
+            except FrameOverwrittenError:
+                log.warning(f"Frame {event.index} was overwritten before it could be saved")
+                return
+        else:
+            frame, done, failed = np.array(self.datastore.get_frame(list(key))), None, None
+        self.tasks.put((self._write, (writer, metadata_log, key, frame, done, failed, event)))
+
+    def _write(self, writer, metadata_log: MetadataLog, key: tuple, frame: np.ndarray,
+               done: callable, failed: callable, event: MDAEvent):
+        "Called in the worker thread, blocks while the writer has too many frames pending."
+        try:
+            writer.write(key, frame, done, failed)
+        except Exception:
+            if failed is not None:
+                failed()
+            raise
+        metadata_log.append(event)
+
+    def _close_stream(self, writer, metadata_log: MetadataLog):
+        "Called in the worker thread, waits for the pending frames of writer."
+        writer.close()
+        metadata_log.close()
+        self.stream_closed.emit(str(writer.path))
+
+    def _work(self):
+        while (task := self.tasks.get()) is not None:
+            function, args = task
+            try:
+                function(*args)
+            except Exception:
+                log.exception(f"Saving failed in {function.__name__}")
+
+    def on_status_timer(self):
+        "Show how the writer keeps up, throughput in MB/s and frames waiting to be written."
+        if self.writer is None:
+            return
+        stats = self.writer.stats()
+        text = f"{stats['frames_written']} frames, queue {stats['depth']}"
+        if "throughput" in stats:
+            text += f", {stats['throughput']/1e6:.0f} MB/s"
+        if "compression" in stats:
+            compression = stats["compression"]
+            text += (f", {compression['codec']} {compression['ratio']:.2f}x at "
+                     f"{compression['throughput']/1e6:.0f} MB/s")
+        self.status.setText(text)
+
+    def on_sequence_finish(self, sequence: MDASequence):
+        """Finalize the store of sequence after its pending frames are written, in the worker
+        thread. A sequence that is not known, because the remote side did not send it, finishes
+        the oldest store."""
+        if sequence.uid in self.streams:
+            writer, metadata_log = self.streams.pop(sequence.uid)
+        elif self.streams:
+            writer, metadata_log = self.streams.pop(next(iter(self.streams)))
+        else:
+            return
+        mmcore.saveSystemState(str(writer.path.parent/f"{writer.path.name}.mm_data.txt"))
+        self.tasks.put((self._close_stream, (writer, metadata_log)))
+
     def save_to_location(self):
         fname = Path(QtWidgets.QFileDialog.getSaveFileName(self, 'Open file',self.save_location)[0])
         self.save_array(fname)
@@ -39,9 +191,20 @@ class Saver(QEventConsumer):
                          array,
                          imagej=True)
         mmcore.saveSystemState(str(fname/'mm_data.txt'))
+        metadata_log = MetadataLog(fname/'frames.bin')
+        if self.records:
+            metadata_log.extend(np.stack(self.records))
+        metadata_log.close()
         self.save_location = str(fname.parent)
 
     def closeEvent(self, e):
+        for writer, metadata_log in self.streams.values():
+            self.tasks.put((self._close_stream, (writer, metadata_log)))
+        self.streams = {}
+        self.tasks.put(None)
+        self._worker.join()
+        if self.cursor is not None:
+            self.cursor.close()
         self.settings.setValue("save_location", self.save_location)
         super().closeEvent(e)
 
@@ -1,37 +1,5 @@
 from __future__ import annotations
-
-class Broker():
-    def __init__(self):
-        self.subscribers = set()
-
-    def attach(self,subscriber: Subscriber):
-        self.subscribers.add(subscriber)
-
-    def route(self, topic, message: str):
-        for subscriber in self.subscribers:
-            if topic in subscriber.sub.topics:
-                subscriber.sub.receive(message)
-
-
-class Publisher():
-    def __init__(self, broker: Broker):
-        self.broker = broker
-
-    def publish(self, topic, message):
-        return self.broker.route(topic, message)
-
-
-class Subscriber():
-    def __init__(self, topics:list[str], routes: dict):
-        self.topics = topics
-        self.routes = routes
-
-    def receive(self, message):
-        print("Subscriber received")
-        callbacks = self.routes.get(message, [])
-        for callback in callbacks:
-            callback()
-
+from pymmcore_eda.broker import Broker, Publisher, Subscriber
 
 class GUI:
     def __init__(self, broker:Broker):
@@ -70,6 +38,6 @@ if __name__ == "__main__":
     broker.attach(gui)
 
     gui._on_live_button_clicked("START LIVE")
-
+    broker.close()
 
     print("Done")
\ No newline at end of file
@@ -0,0 +1,158 @@
+from logging import getLogger
+from pathlib import Path
+import os
+import queue
+import threading
+import time
+import numpy as np
+import tifffile
+from useq import MDASequence
+
+log = getLogger(__name__)
+
+QUEUE_SIZE = 64  # frames waiting for the writer thread before write blocks
+
+
+class TiffWriter:
+    """Appends frames to a BigTIFF at path in the order they arrive, on a dedicated thread.
+
+    write puts the frame into a queue of queue_size frames and returns. If the queue is full it
+    blocks until the writer thread has caught up, the time spent waiting is counted in
+    blocked_time. The pages are written without metadata, at finish the OME-XML for the frames
+    that were written is put into the first page, so a run that was cut short is still a valid
+    OME-TIFF.
+    """
+    def __init__(self, path: str|os.PathLike, queue_size: int = QUEUE_SIZE):
+        self.path = Path(path)
+        self.sequence = None
+        self.finished = False
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.blocked_time = 0.
+        self.depth_max = 0
+        self.keys = []
+        self._tif = None
+        self._start_time = None
+        self.queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def start(self, sequence: MDASequence|None = None):
+        self.sequence = sequence
+        self.finished = False
+        self.queue.put(("start", None, (None, None, None)))
+
+    def write(self, key: tuple, frame: np.ndarray, done: callable = None,
+              failed: callable = None):
+        """Append frame at key [t, z, c]. The frame is only read in the writer thread, it must
+        not change until it has been written. That is signalled by calling done once it is
+        written, or failed if it could not be written."""
+        start = time.perf_counter()
+        self.queue.put(("frame", tuple(int(x) for x in key), (frame, done, failed)))
+        self.blocked_time += time.perf_counter() - start
+        self.depth_max = max(self.depth_max, self.queue.qsize())
+
+    def finish(self):
+        "Wait for the queued frames and write the OME-XML."
+        self.queue.put(("finish", None, (None, None, None)))
+        self.queue.join()
+        self.finished = True
+
+    def close(self):
+        if not self.finished:
+            self.finish()
+        self.queue.put(None)
+        self._thread.join()
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    @property
+    def throughput(self) -> float:
+        "Bytes written per second since the first frame."
+        if self._start_time is None:
+            return 0.
+        return self.bytes_written/max(time.perf_counter() - self._start_time, 1e-9)
+
+    def stats(self) -> dict:
+        return {"frames_written": self.frames_written, "throughput": self.throughput,
+                "depth": self.depth, "depth_max": self.depth_max,
+                "blocked_time": self.blocked_time}
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                action, key, (frame, done, failed) = item
+                match action:
+                    case "start":
+                        self._close_file()
+                        self.path.parent.mkdir(parents=True, exist_ok=True)
+                        self._tif = tifffile.TiffWriter(self.path, bigtiff=True, ome=False)
+                        self.keys = []
+                    case "frame":
+                        if self._start_time is None:
+                            self._start_time = time.perf_counter()
+                        try:
+                            self._tif.write(frame, contiguous=True)
+                        except Exception:
+                            if failed is not None:
+                                failed()
+                            raise
+                        if done is not None:
+                            done()
+                        self.keys.append(key)
+                        self.frames_written += 1
+                        self.bytes_written += frame.nbytes
+                    case "finish":
+                        self._close_file()
+            except Exception:
+                self.errors += 1
+                log.exception(f"Failed to {item[0]} {self.path}")
+            finally:
+                self.queue.task_done()
+
+    def _close_file(self):
+        if self._tif is None:
+            return
+        self._tif.close()
+        self._tif = None
+        if self.keys:
+            tifffile.tiffcomment(self.path, self.ome_xml())
+
+    def ome_xml(self) -> str:
+        """OME-XML for the frames written so far. The axes are ordered like the acquisition, the
+        outermost one is as long as the written frames allow. If they don't fill it evenly, or
+        the pages were not written in the raster order of the axes, e.g. for frames of events
+        that were added during the acquisition, the frames are described as a time series."""
+        with tifffile.TiffFile(self.path) as tif:
+            shape, dtype = tif.pages[0].shape, tif.pages[0].dtype
+        sequence = self.sequence if self.sequence is not None else MDASequence()
+        order = [ax for ax in sequence.axis_order if ax in "tcz"]
+        sizes = {ax: max(sequence.sizes.get(ax, 0), 1) for ax in order}
+        inner = int(np.prod([sizes[ax] for ax in order[1:]]))
+        sizes[order[0]] = len(self.keys)//inner
+        metadata = {}
+        if len(self.keys) % inner == 0 and self._in_raster_order(order, sizes):
+            axes = "".join(ax.upper() for ax in order) + "YX"
+            image_shape = tuple(sizes[ax] for ax in order) + tuple(shape)
+            channels = [channel.config for channel in sequence.channels]
+            if channels and len(channels) == sizes["c"]:
+                metadata["Channel"] = {"Name": channels}
+        else:
+            axes, image_shape = "TYX", (len(self.keys), *shape)
+        ome = tifffile.OmeXml()
+        ome.addimage(dtype, image_shape, (len(self.keys), 1, 1, *shape, 1), axes=axes,
+                     **metadata)
+        return ome.tostring()
+
+    def _in_raster_order(self, order: list[str], sizes: dict) -> bool:
+        "Whether the keys [t, z, c] of the pages follow the raster of the axes in order."
+        raster = np.unravel_index(np.arange(len(self.keys)), [sizes[ax] for ax in order])
+        position = dict(zip(order, raster))
+        expected = zip(*(position.get(ax, np.zeros(len(self.keys), int)) for ax in "tzc"))
+        return all(tuple(map(int, a)) == b for a, b in zip(expected, self.keys))
@@ -0,0 +1,99 @@
+from qtpy import QtCore
+import threading
+import numpy as np
+
+PERCENTILES = (0.1, 99.9)
+STRIDE = 4  # every STRIDE-th pixel along each axis is sampled
+SMOOTHING = 0.3  # weight of the newest limits, 1 = no smoothing
+
+
+def robust_limits(img: np.ndarray, percentiles: tuple = PERCENTILES,
+                  stride: int = STRIDE) -> tuple[float, float]:
+    """Limits at percentiles of a strided subsample of img. Integer images of up to 16 bit are
+    evaluated from a histogram of the sample, which needs no sorting."""
+    sample = np.asarray(img)[::stride, ::stride].ravel()
+    if sample.size == 0:
+        return 0., 1.
+    if sample.dtype.kind == "u" and sample.dtype.itemsize <= 2:
+        cdf = np.cumsum(np.bincount(sample))
+        low, high = (int(np.searchsorted(cdf, max(p/100*cdf[-1], 1))) for p in percentiles)
+    else:
+        low, high = np.percentile(sample, percentiles)
+    return float(low), float(high)
+
+
+def histogram_limits(histogram: np.ndarray, shift: int,
+                     percentiles: tuple = PERCENTILES) -> tuple[float, float]:
+    """Limits at percentiles of a histogram with bins of width 2**shift from 0, like the one of
+    frame_stats, interpolated linearly inside the bins. No pixels are read."""
+    cdf = np.concatenate([[0], np.cumsum(histogram, dtype=np.float64)])
+    if not cdf[-1]:
+        return 0., 1.
+    edges = np.arange(len(cdf)) << int(shift)
+    low, high = (float(np.interp(p/100*cdf[-1], cdf, edges)) for p in percentiles)
+    return low, high
+
+
+def contrast_limits(item: np.ndarray|dict, percentiles: tuple = PERCENTILES,
+                    stride: int = STRIDE) -> tuple[float, float]:
+    """Limits from the frame_stats of a frame if they have a histogram, otherwise from the
+    pixels of the frame."""
+    if isinstance(item, dict):
+        return histogram_limits(item["histogram"], item["histogram_shift"], percentiles)
+    return robust_limits(item, percentiles, stride)
+
+
+class AutoContrast(QtCore.QObject):
+    """Computes the contrast limits of frames in a worker thread and smooths them over time per
+    channel. A frame is submitted as its frame_stats, or as its pixels if there are none. Frames
+    that are submitted while the worker is busy replace the waiting frame of their channel, so
+    only the latest one is evaluated."""
+    limits_ready = QtCore.Signal(int, float, float)
+
+    def __init__(self, percentiles: tuple = PERCENTILES, stride: int = STRIDE,
+                 smoothing: float = SMOOTHING):
+        super().__init__()
+        self.percentiles = percentiles
+        self.stride = stride
+        self.smoothing = smoothing
+        self.limits = {}
+        self._pending = {}
+        self._running = True
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def submit(self, img: np.ndarray|dict, channel: int = 0):
+        with self._condition:
+            self._pending[channel] = img
+            self._condition.notify()
+
+    def reset(self, channel: int|None = None):
+        "Forget the smoothed limits, for example on a new sequence."
+        with self._condition:
+            if channel is None:
+                self.limits = {}
+            else:
+                self.limits.pop(channel, None)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or not self._running)
+                if not self._running:
+                    return
+                channel, img = self._pending.popitem()
+            low, high = contrast_limits(img, self.percentiles, self.stride)
+            with self._condition:
+                if channel in self.limits:
+                    old_low, old_high = self.limits[channel]
+                    low = old_low + self.smoothing*(low - old_low)
+                    high = old_high + self.smoothing*(high - old_high)
+                self.limits[channel] = (low, high)
+            self.limits_ready.emit(channel, low, high)
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
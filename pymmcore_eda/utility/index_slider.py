@@ -1,6 +1,61 @@
 from qtpy import QtWidgets, QtCore, QtGui
 import time
 
+PLAYBACK_FPS = 20
+PLAYBACK_MODES = ("loop", "pingpong", "step")
+
+
+class PlaybackEngine:
+    """Decides which value a playing slider should show, for a target fps. In loop and pingpong
+    mode the value follows the clock, so if showing a frame takes longer than 1/fps the frames in
+    between are skipped and playback stays on time. In step mode every value is shown, at most
+    fps per second. Values run from 0 to maximum, inclusive."""
+    def __init__(self, fps: float = PLAYBACK_FPS, mode: str = "loop", clock=time.perf_counter):
+        if mode not in PLAYBACK_MODES:
+            raise ValueError(f"Unknown mode {mode}, use one of {PLAYBACK_MODES}")
+        self.fps = fps
+        self.mode = mode
+        self.clock = clock
+        self.start(0, 0)
+
+    def start(self, value: int, maximum: int):
+        self.start_value = value
+        self.maximum = maximum
+        self.start_time = self.clock()
+        self._epoch = self.start_time
+        self.steps = 0
+        self.shown = 0
+        self.skipped = 0
+
+    def next_value(self) -> int|None:
+        "Value to show now, None if the current one is still due."
+        now = self.clock()
+        due = int((now - self._epoch)*self.fps)
+        if due <= self.steps:
+            return None
+        if self.mode == "step":
+            # Fall behind instead of catching up in a burst
+            due = self.steps + 1
+            self._epoch = max(self._epoch, now - due/self.fps)
+        self.skipped += due - self.steps - 1
+        self.steps = due
+        self.shown += 1
+        return self.value_at(self.start_value + due)
+
+    def value_at(self, position: int) -> int:
+        if self.maximum <= 0:
+            return 0
+        if self.mode == "pingpong":
+            position = position % (2*self.maximum)
+            return position if position <= self.maximum else 2*self.maximum - position
+        return position % (self.maximum + 1)
+
+    @property
+    def achieved_fps(self) -> float:
+        elapsed = self.clock() - self.start_time
+        return self.shown/elapsed if elapsed > 0 else 0.
+
+
 class QLabeledSlider(QtWidgets.QWidget):
     """Slider that shows name of the axis and current value."""
     valueChanged = QtCore.Signal([int], [int, str])
@@ -48,7 +103,9 @@ class QLabeledSlider(QtWidgets.QWidget):
         self.playing = False
 
 
-        self.play_timer = QtCore.QTimer(interval=10)
+        self.playback = PlaybackEngine()
+        self.play_timer = QtCore.QTimer(interval=5)
+        self.play_timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
         self.play_timer.timeout.connect(self.on_play_timer)
 
         self.drag_timer = QtCore.QTimer(interval=10)
@@ -56,14 +113,31 @@ class QLabeledSlider(QtWidgets.QWidget):
 
     def _start_play_timer(self, playing):
         if playing:
-            self.play_timer.start(0.01)
+            self.playback.start(self.value(), self.maximum())
+            self.play_timer.start()
         else:
             self.play_timer.stop()
 
     def on_play_timer(self, _=None):
-        value = self.value() + 1
-        value = value % self.maximum()
+        "Poll the PlaybackEngine, several times per frame so it is on time."
+        if self.playback.maximum != self.maximum():
+            self.playback.start(self.value(), self.maximum())
+        value = self.playback.next_value()
+        if value is None:
+            return
         self.setValue(value)
+        self.play_btn.setToolTip(f"{self.playback.achieved_fps:.1f}/{self.playback.fps:g} fps, "
+                                 f"{self.playback.skipped} frames skipped")
+
+    def setFps(self, fps: float):
+        self.playback.fps = fps
+        self.playback.start(self.value(), self.maximum())
+
+    def setPlaybackMode(self, mode: str):
+        if mode not in PLAYBACK_MODES:
+            raise ValueError(f"Unknown mode {mode}, use one of {PLAYBACK_MODES}")
+        self.playback.mode = mode
+        self.playback.start(self.value(), self.maximum())
 
     # def handle_valueChanged(self, value):
     #     self.current_value.setText(f"{str(value)}/{str(self.slider.maximum())}")
@@ -90,6 +164,7 @@ class QLabeledSlider(QtWidgets.QWidget):
             self.play_timer.stop()
         else:
             self.play_btn.setText("■")
+            self.playback.start(self.value(), self.maximum())
             self.play_timer.start()
         self.playing = not self.playing
 
@@ -0,0 +1,95 @@
+from qtpy import QtCore
+import threading
+import numpy as np
+
+MIN_SIZE = 256  # the smallest level is at least this many pixels along its shorter axis
+TILE_SIZE = 256  # regions uploaded from a level are aligned to tiles of this size
+
+
+def downsample(img: np.ndarray) -> np.ndarray:
+    "Mean of 2x2 blocks of img, an odd last row or column is dropped."
+    h, w = img.shape[0]//2*2, img.shape[1]//2*2
+    blocks = img[:h, :w].reshape(h//2, 2, w//2, 2)
+    if img.dtype.kind in "ui":
+        return (blocks.sum(axis=(1, 3), dtype=np.int64)//4).astype(img.dtype)
+    return blocks.mean(axis=(1, 3)).astype(img.dtype)
+
+
+class Pyramid:
+    """Levels of a frame, each downsampled 2x from the one before. Level 0 is the frame itself,
+    the other levels are only computed when they are first accessed."""
+    def __init__(self, img: np.ndarray, min_size: int = MIN_SIZE):
+        self.levels = [img]
+        self.n_levels = 1 + max(0, int(np.log2(max(min(img.shape[:2]), 1)/min_size)))
+
+    def __len__(self) -> int:
+        return self.n_levels
+
+    def __getitem__(self, level: int) -> np.ndarray:
+        level = min(max(level, 0), self.n_levels - 1)
+        while len(self.levels) <= level:
+            self.levels.append(downsample(self.levels[-1]))
+        return self.levels[level]
+
+    def is_built(self, level: int) -> bool:
+        "Whether level can be accessed without computing it."
+        return min(max(level, 0), self.n_levels - 1) < len(self.levels)
+
+
+class PyramidBuilder(QtCore.QObject):
+    """Builds pyramid levels in a worker thread, so downsampling never runs where the frames are
+    shown. Levels that are submitted while the worker is busy replace the waiting one of their
+    channel, only the latest is built. level_ready is emitted with the channel and the pyramid
+    once the level is built."""
+    level_ready = QtCore.Signal(int, object)
+
+    def __init__(self):
+        super().__init__()
+        self._pending = {}
+        self._running = True
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def submit(self, pyramid: Pyramid, level: int, channel: int = 0):
+        with self._condition:
+            self._pending[channel] = (pyramid, level)
+            self._condition.notify()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or not self._running)
+                if not self._running:
+                    return
+                channel, (pyramid, level) = self._pending.popitem()
+            pyramid[level]
+            self.level_ready.emit(channel, pyramid)
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+
+
+def choose_level(data_per_pixel: float, n_levels: int) -> int:
+    """Coarsest level that still has at least one data pixel per screen pixel, data_per_pixel is
+    how many full resolution pixels one screen pixel covers."""
+    if data_per_pixel <= 1:
+        return 0
+    return min(int(np.log2(data_per_pixel)), n_levels - 1)
+
+
+def visible_region(rect: tuple, shape: tuple, level: int,
+                   tile_size: int = TILE_SIZE) -> tuple[slice, slice]:
+    """Slices (y, x) into the image of level that cover rect (left, bottom, width, height) in
+    full resolution coordinates, extended to whole tiles."""
+    scale = 2**level
+    left, bottom, width, height = rect
+    region = []
+    for start, size, length in [(bottom, height, shape[0]), (left, width, shape[1])]:
+        low = max(int(np.floor(start/scale/tile_size))*tile_size, 0)
+        high = min(max(int(np.ceil((start + size)/scale/tile_size))*tile_size, 0), length)
+        region.append(slice(min(low, high), high))
+    return tuple(region)
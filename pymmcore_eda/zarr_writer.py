@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+import json
+import os
+import threading
+import time
+import numpy as np
+from useq import MDASequence
+
+from pymmcore_eda.compression import get_codec
+
+log = getLogger(__name__)
+
+MAX_PENDING = 32  # frames handed to the writer pool that are not written yet
+METADATA_INTERVAL = 1  # s between updates of the array shape while the store is growing
+# OME-NGFF axes, the datastores index frames as [t, z, c]
+AXES = [("t", "time"), ("c", "channel"), ("z", "space"), ("y", "space"), ("x", "space")]
+
+
+class ZarrWriter:
+    """Streams frames into an OME-Zarr store (NGFF 0.4 on zarr v2) at path while they are
+    acquired, without depending on zarr. Every frame is one chunk, written by a thread pool.
+
+    write returns immediately, unless MAX_PENDING frames are waiting for the pool already, then
+    it blocks until one is written. That bounds the memory held by the writer and slows down a
+    producer that is faster than the disk. Chunks are in the file system as soon as they are
+    written; the array shape in the metadata follows every METADATA_INTERVAL and is final
+    after finish.
+
+    With compression ("zlib", "zstd" or "lz4", see compression.get_codec) every chunk is
+    compressed in the pool before it is written, the compression ratio and throughput are in
+    stats.
+    """
+    def __init__(self, path: str|os.PathLike, max_workers: int = 4,
+                 max_pending: int = MAX_PENDING, compression: str|None = None,
+                 level: int|None = None):
+        self.path = Path(path)
+        self.codec = get_codec(compression, level) if compression else None
+        self.sequence = None
+        self.shape = None
+        self.dtype = None
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.finished = False
+        self._pending = 0
+        self._max_pending = max_pending
+        self._metadata_time = 0.
+        self._condition = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="ZarrWriter")
+
+    def start(self, sequence: MDASequence|None = None):
+        "Begin a new store, the array is created at the first frame."
+        self.sequence = sequence
+        self.shape = None
+        self.finished = False
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path/".zgroup").write_text(json.dumps({"zarr_format": 2}))
+        attrs = {"multiscales": [{
+            "version": "0.4",
+            "name": self.path.stem,
+            "axes": [{"name": name, "type": kind} for name, kind in AXES],
+            "datasets": [{"path": "0", "coordinateTransformations": [
+                {"type": "scale", "scale": [1.]*len(AXES)}]}]}]}
+        if sequence is not None:
+            attrs["mda_sequence"] = sequence.model_dump(mode="json")
+        (self.path/".zattrs").write_text(json.dumps(attrs))
+
+    def write(self, key: tuple, frame: np.ndarray, done: callable = None,
+              failed: callable = None):
+        """Write frame at key [t, z, c]. The frame is only read in the pool, it must not change
+        until the write has finished. That is signalled by calling done once it is written, or
+        failed if it could not be written."""
+        if self.shape is None:
+            self._create_array(frame)
+        t, z, c = (int(x) for x in key)
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending < self._max_pending)
+            self._pending += 1
+            self.shape[0] = max(self.shape[0], t + 1)
+            self.shape[1] = max(self.shape[1], c + 1)
+            self.shape[2] = max(self.shape[2], z + 1)
+        self._pool.submit(self._write_chunk, (t, c, z), frame, done, failed)
+        # Frames can still trickle in after finish, the metadata has to follow them
+        if self.finished or time.monotonic() - self._metadata_time > METADATA_INTERVAL:
+            self._write_array_metadata()
+
+    def _create_array(self, frame: np.ndarray):
+        sizes = self.sequence.sizes if self.sequence is not None else {}
+        self.shape = [max(sizes.get(dim, 0), 1) for dim, _ in AXES[:3]] + list(frame.shape)
+        self.dtype = frame.dtype
+        (self.path/"0").mkdir(parents=True, exist_ok=True)
+        self._write_array_metadata()
+
+    def _write_array_metadata(self):
+        self._metadata_time = time.monotonic()
+        with self._condition:
+            shape = list(self.shape)
+        zarray = {"zarr_format": 2, "shape": shape, "chunks": [1, 1, 1, *shape[3:]],
+                  "dtype": self.dtype.str, "compressor": self.codec and self.codec.config,
+                  "fill_value": 0, "order": "C", "filters": None, "dimension_separator": "/"}
+        temp_path = self.path/"0"/".zarray.tmp"
+        temp_path.write_text(json.dumps(zarray))
+        os.replace(temp_path, self.path/"0"/".zarray")
+
+    def _write_chunk(self, index: tuple, frame: np.ndarray, done: callable = None,
+                     failed: callable = None):
+        try:
+            chunk_path = self.path/"0"/"/".join(str(i) for i in (*index, 0, 0))
+            chunk_path.parent.mkdir(parents=True, exist_ok=True)
+            data = np.ascontiguousarray(frame, dtype=self.dtype)
+            with open(chunk_path, "wb") as file:
+                file.write(self.codec.compress(data.data) if self.codec else data.data)
+            with self._condition:
+                self.frames_written += 1
+                self.bytes_written += data.nbytes
+        except Exception:
+            self.errors += 1
+            log.exception(f"Failed to write chunk {index} to {self.path}")
+            if failed is not None:
+                failed()
+        else:
+            if done is not None:
+                done()
+        finally:
+            with self._condition:
+                self._pending -= 1
+                self._condition.notify_all()
+
+    def stats(self) -> dict:
+        stats = {"frames_written": self.frames_written, "bytes_written": self.bytes_written,
+                 "depth": self._pending, "errors": self.errors}
+        if self.codec is not None:
+            stats["compression"] = self.codec.stats()
+        return stats
+
+    def finish(self):
+        "Wait for the pending frames and write the final metadata."
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending == 0)
+        if self.shape is not None:
+            self._write_array_metadata()
+        self.finished = True
+
+    def close(self):
+        self.finish()
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,42 @@
+import numpy as np
+from pymmcore_eda.frame_index import frame_stats
+from pymmcore_eda.utility.autocontrast import (AutoContrast, contrast_limits, histogram_limits,
+                                               robust_limits)
+
+
+def test_robust_limits():
+    rng = np.random.default_rng(0)
+    img = rng.integers(100, 1000, (512, 512), dtype=np.uint16)
+    img[0, 0] = 60000
+    low, high = robust_limits(img)
+    assert 100 <= low < 110
+    assert 990 < high <= 1000
+    float_low, float_high = robust_limits(img.astype(np.float32))
+    assert abs(float_low - low) < 2 and abs(float_high - high) < 2
+    assert robust_limits(np.full((8, 8), 5, np.uint16)) == (5., 5.)
+
+
+def test_histogram_limits():
+    rng = np.random.default_rng(0)
+    img = rng.integers(100, 1000, (512, 512), dtype=np.uint16)
+    stats = frame_stats(img)
+    low, high = histogram_limits(stats["histogram"], stats["histogram_shift"])
+    # Bins are 16 wide here
+    assert abs(low - 100) < 16 and abs(high - 1000) < 16
+    assert contrast_limits(stats) == (low, high)
+    assert contrast_limits(img) == robust_limits(img)
+    assert histogram_limits(np.zeros(64), 0) == (0., 1.)
+
+
+def test_smoothing(qtbot):
+    autocontrast = AutoContrast(smoothing=0.5, stride=1)
+    limits = []
+    autocontrast.limits_ready.connect(lambda c, low, high: limits.append((c, low, high)))
+    with qtbot.waitSignal(autocontrast.limits_ready, timeout=1000):
+        autocontrast.submit(np.full((8, 8), 100, np.uint16), 1)
+    with qtbot.waitSignal(autocontrast.limits_ready, timeout=1000):
+        autocontrast.submit(np.full((8, 8), 200, np.uint16), 1)
+    assert limits == [(1, 100., 100.), (1, 150., 150.)]
+    autocontrast.reset()
+    assert autocontrast.limits == {}
+    autocontrast.close()
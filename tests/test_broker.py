@@ -0,0 +1,53 @@
+from pymmcore_eda.broker import Broker, Publisher, Subscriber
+import threading
+import time
+
+
+def test_routing():
+    broker = Broker()
+    received = {"gui": [], "all": [], "other": []}
+    subscribers = {"gui": Subscriber(["gui.*"], {m: [lambda m=m: received["gui"].append(m)]
+                                                for m in ["a", "b"]}),
+                   "all": Subscriber(["*"], {m: [lambda m=m: received["all"].append(m)]
+                                            for m in ["a", "b"]}),
+                   "other": Subscriber(["backend"], {m: [lambda m=m: received["other"].append(m)]
+                                                    for m in ["a", "b"]})}
+    for subscriber in subscribers.values():
+        broker.attach(subscriber)
+    publisher = Publisher(broker)
+    for i in range(100):
+        publisher.publish("gui.live", "a" if i % 2 else "b")
+    broker.close()
+    assert received["gui"] == ["b", "a"]*50
+    assert received["all"] == ["b", "a"]*50
+    assert received["other"] == []
+    assert subscribers["gui"].stats()["delivered"] == 100
+    assert subscribers["gui"].depth == 0
+
+
+def test_publisher_does_not_block():
+    broker = Broker()
+    release = threading.Event()
+    slow = Subscriber(["topic"], {"message": [release.wait]})
+    broker.attach(slow)
+    t0 = time.perf_counter()
+    for _ in range(10):
+        broker.route("topic", "message")
+    assert time.perf_counter() - t0 < 0.1
+    assert slow.depth_max >= 9
+    release.set()
+    broker.close()
+    assert slow.delivered == 10
+    assert slow.latency_max > 0
+
+
+def test_detach():
+    broker = Broker()
+    received = []
+    subscriber = Subscriber(["topic"], {"message": [lambda: received.append(1)]})
+    broker.attach(subscriber)
+    broker.route("topic", "message")
+    broker.detach(subscriber)
+    broker.route("topic", "message")
+    broker.close()
+    assert received == [1]
@@ -1,5 +1,9 @@
-from pymmcore_eda.buffered_datastore import BufferedDataStore
+from pymmcore_eda import buffered_datastore
+from pymmcore_eda.buffered_datastore import BufferedDataStore, FrameOverwrittenError, SaveCursor
 from pymmcore_plus import CMMCorePlus
+import numpy as np
+import pytest
+import time
 from useq import MDASequence
 from unittest.mock import Mock
 
@@ -40,4 +44,64 @@ def test_event():
     datastore.frame_ready.connect(mock_sender2)
     mmcore.run_mda(sequence2, block=True)
     assert mock_sender2.call_count == 10
-    assert mock_sender.call_count == 12
\ No newline at end of file
+    assert mock_sender.call_count == 12
+
+
+def test_save_cursor(monkeypatch):
+    datastore = BufferedDataStore(create=True)
+    remote = BufferedDataStore(name=datastore._shm.name, create=False)
+    events = list(MDASequence(time_plan={"interval": 0, "loops": 3}))
+    img = np.ones((64, 64), np.uint16)
+    cursor = SaveCursor(remote)
+    for event in events:
+        datastore.new_frame(img, event)
+    frames = [cursor.add(event.index) for event in events]
+    assert not frames[0][0].flags.writeable
+    frames[1][1]()
+    assert datastore.shared_index.saved == 0
+    frames[0][1]()
+    assert datastore.shared_index.saved == 2*img.size
+    frames[2][1]()
+    assert datastore.shared_index.saved == 3*img.size
+
+    # Overwriting anything after the cursor waits for the saver, up to SAVE_TIMEOUT
+    monkeypatch.setattr(buffered_datastore, "SAVE_TIMEOUT", 0.05)
+    start = time.perf_counter()
+    datastore._wait_for_saver(3*img.size + 1)
+    assert time.perf_counter() - start >= 0.05
+    start = time.perf_counter()
+    datastore._wait_for_saver(3*img.size)
+    assert time.perf_counter() - start < 0.05
+    # The saver did not catch up in time, it is dropped and not waited for again
+    assert datastore.shared_index.saved is None
+    cursor.close()
+    assert datastore.shared_index.saved is None
+
+
+def test_save_cursor_failures():
+    datastore = BufferedDataStore(create=True)
+    remote = BufferedDataStore(name=datastore._shm.name, create=False)
+    events = list(MDASequence(time_plan={"interval": 0, "loops": 2}))
+    img = np.ones((64, 64), np.uint16)
+    cursor = SaveCursor(remote)
+    datastore.new_frame(img, events[0])
+    # A frame that is gone already is not added, so it can't block the cursor
+    written = datastore.shared_index.written
+    datastore.shared_index.written = written + datastore.size
+    with pytest.raises(FrameOverwrittenError):
+        cursor.add(events[0].index)
+    assert not cursor._frames
+    datastore.shared_index.written = written
+    frame, done, failed = cursor.add(events[0].index)
+    failed()
+    assert cursor.failed == 1
+    assert datastore.shared_index.saved == img.size
+
+    # A saver that is gone is dropped without waiting
+    cursor._closed.set()
+    cursor._heartbeat.join()
+    datastore.shared_index.header[6] -= 1000*(buffered_datastore.HEARTBEAT_TIMEOUT + 1)
+    start = time.perf_counter()
+    datastore._wait_for_saver(2*img.size)
+    assert time.perf_counter() - start < 0.1
+    assert datastore.shared_index.saved is None
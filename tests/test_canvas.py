@@ -41,6 +41,7 @@ def test_remote(qtbot):
             pass
         with qtbot.waitSignal(datastore.frame_ready, timeout=5000):
             pass
+        qtbot.waitUntil(lambda: canvas.frames_shown > 0, timeout=1000)
     assert canvas.images[0]._data.shape == (512, 512)
     assert canvas.images[0]._data.flatten()[0] != 0
 
@@ -56,6 +57,7 @@ def test_local(qtbot):
             pass
         with qtbot.waitSignal(datastore.frame_ready, timeout=5000):
             pass
+        qtbot.waitUntil(lambda: canvas.frames_shown > 0, timeout=1000)
     assert canvas.images[0]._data.shape == (512, 512)
     assert canvas.images[0]._data.flatten()[0] != 0
     assert canvas.images[1]._data.shape == (512, 512)
@@ -68,4 +70,16 @@ def test_local(qtbot):
     qtbot.wait(500)
     qtbot.mouseMove(canvas, QtCore.QPoint(200, 200))
     qtbot.wait(1000)
-    assert canvas.info_bar.text() != ""
\ No newline at end of file
+    assert canvas.info_bar.text() != ""
+
+def test_latest_frame_wins(qtbot):
+    datastore = QLocalDataStore(shape=[20, 1, 1, 512, 512])
+    canvas = Canvas(mmcore, datastore, display_rate=2)
+    qtbot.addWidget(canvas)
+    fast_sequence = MDASequence(channels=[{"config": "DAPI", "exposure": 1}],
+                                time_plan={"interval": 0, "loops": 20})
+    with qtbot.waitSignals([datastore.frame_ready]*20, timeout=5000):
+        mmcore.run_mda(fast_sequence)
+    qtbot.waitUntil(lambda: not canvas.mailbox, timeout=2000)
+    assert canvas.frames_shown + canvas.frames_dropped == 20
+    assert canvas.frames_dropped > 0
@@ -0,0 +1,67 @@
+from pymmcore_eda.chunked_array import ChunkedArray, MappedArray, load_raw
+import numpy as np
+import pytest
+
+
+def test_growth_without_copy():
+    array = ChunkedArray([1, 1, 2, 16, 8], chunk_size=4)
+    array[0, 0, 1] = 1
+    first_chunk = array.chunks[0]
+    for t in range(1, 30):
+        array[t, 0, t % 2] = t
+    assert array.shape == (30, 1, 2, 16, 8)
+    assert len(array.chunks) == 8
+    assert array.chunks[0] is first_chunk
+    assert array[0, 0, 1][0, 0] == 1
+    assert array[29, 0, 1, :, :].shape == (16, 8)
+    assert array[-1, 0, 1][0, 0] == 29
+    with pytest.raises(IndexError):
+        array[30]
+
+
+def test_view():
+    array = ChunkedArray([2, 1, 1, 4, 4])
+    frame = array[1, 0, 0, :, :]
+    array[1, 0, 0] = 7
+    assert frame.max() == 7
+
+
+def test_grow_inner_axes():
+    array = ChunkedArray([2, 1, 1, 4, 4], chunk_size=2)
+    array[1, 0, 0] = 3
+    with pytest.raises(IndexError):
+        array[1, 0, 2] = 1
+    array.grow([2, 1, 3, 4, 4])
+    array[1, 0, 2] = 1
+    assert array.shape == (2, 1, 3, 4, 4)
+    assert array[1, 0, 0].max() == 3
+
+
+def test_asarray():
+    array = ChunkedArray([5, 1, 1, 2, 2], dtype=np.uint16, chunk_size=2)
+    for t in range(5):
+        array[t, 0, 0] = t
+    data = np.asarray(array)
+    assert data.shape == (5, 1, 1, 2, 2)
+    assert data.dtype == np.uint16
+    assert list(data[:, 0, 0, 0, 0]) == [0, 1, 2, 3, 4]
+    assert array[1:3].shape == (2, 1, 1, 2, 2)
+    assert array.nbytes == data.nbytes
+
+
+def test_mapped(tmp_path):
+    path = tmp_path / "run" / "sequence.raw"
+    array = MappedArray(path, [1, 1, 1, 8, 8], chunk_size=4)
+    for t in range(10):
+        array[t, 0, 0] = t
+    assert path.stat().st_size == 12*8*8*2
+    array.grow([10, 1, 2, 8, 8])
+    array[9, 0, 1] = 100
+    assert array[5, 0, 0].max() == 5
+    assert np.asarray(array)[9, 0, 1, 0, 0] == 100
+    array.close()
+    data = load_raw(path)
+    assert data.shape == (10, 1, 2, 8, 8)
+    assert list(data[:, 0, 0, 0, 0]) == list(range(10))
+    assert data[9, 0, 1].max() == 100
+    assert not path.with_suffix(".raw.tmp").exists()
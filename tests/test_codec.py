@@ -0,0 +1,89 @@
+from pymmcore_eda.codec import BinaryCodec, Decoder, FrameEvent, YamlCodec, decode
+from pymmcore_eda.metadata_log import event_record
+from useq import MDASequence
+
+sequence = MDASequence(
+    channels=[{"config": "DAPI", "exposure": 10}, {"config": "FITC", "exposure": 10}],
+    time_plan={"interval": 0, "loops": 3},
+    axis_order="tpcz",
+    )
+
+
+def test_sequence_started():
+    for codec in [YamlCodec(), BinaryCodec()]:
+        name, args = decode(codec.encode_sequence_started(sequence))
+        assert name == "sequence_started"
+        assert args[0] == sequence
+        assert args[0].uid == sequence.uid
+
+
+def test_sequence_finished():
+    decoder = Decoder()
+    codec = BinaryCodec()
+    decoder.decode(codec.encode_sequence_started(sequence))
+    name, args = decoder.decode(codec.encode_sequence_finished(sequence))
+    assert name == "sequence_finished"
+    assert args[0] is decoder.sequences[sequence.uid]
+    name, args = decode(codec.encode_sequence_finished(sequence))
+    assert name == "sequence_finished" and args[0].uid == sequence.uid
+
+
+def test_frame_ready():
+    event = list(sequence)[3]
+    for codec in [YamlCodec(), BinaryCodec()]:
+        name, (decoded, shape, index) = decode(codec.encode_frame_ready(event, (512, 256), 2**40))
+        assert name == "frame_ready"
+        assert decoded.index["t"] == 1 and decoded.index["c"] == 1
+        assert shape == (512, 256)
+        assert index == 2**40
+
+
+def test_timestamp():
+    event = FrameEvent(list(sequence)[3].index, timestamp=1234.5, event=list(sequence)[3])
+    for codec in [YamlCodec(), BinaryCodec()]:
+        name, (decoded, shape, index) = decode(codec.encode_frame_ready(event, (512, 256), 0))
+        assert decoded.timestamp == 1234.5
+        assert event_record(decoded)["timestamp"] == 1234.5
+
+
+def test_binary_size():
+    event = list(sequence)[3]
+    assert len(BinaryCodec().encode_frame_ready(event, (512, 512), 0)) < 64
+
+
+def test_sequence_relative():
+    codec = BinaryCodec()
+    decoder = Decoder()
+    decoder.decode(codec.encode_sequence_started(sequence))
+    event = list(sequence)[3]
+    _, (decoded, _, _) = decoder.decode(codec.encode_frame_ready(event, (512, 512), 0))
+    assert isinstance(decoded, FrameEvent)
+    assert decoded._event is None
+    assert decoded.index["c"] == 1
+    assert decoded.channel.config == "FITC"
+    assert decoded.event == event
+
+
+def test_lookup_lazy():
+    codec = BinaryCodec()
+    decoder = Decoder()
+    long_sequence = MDASequence(channels=["DAPI", "FITC"],
+                                time_plan={"interval": 0, "loops": 10_000})
+    decoder.decode(codec.encode_sequence_started(long_sequence))
+    events = list(long_sequence)[:3]
+    assert decoder.lookup(long_sequence.uid, events[2].index) == events[2]
+    assert decoder.lookup(long_sequence.uid, events[0].index) == events[0]
+    _, skipped = decoder._events[long_sequence.uid]
+    assert list(skipped) == [(1, 0, 0, 0, 0)]
+    decoder.decode(codec.encode_sequence_finished(long_sequence))
+    assert long_sequence.uid not in decoder._events
+    assert decoder.lookup(long_sequence.uid, events[1].index) == events[1]
+
+
+def test_keep_sequences():
+    codec = BinaryCodec()
+    decoder = Decoder()
+    for _ in range(20):
+        short_sequence = MDASequence(time_plan={"interval": 0, "loops": 2})
+        decoder.decode(codec.encode_sequence_started(short_sequence))
+    assert len(decoder.sequences) == 8
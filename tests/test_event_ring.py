@@ -0,0 +1,88 @@
+from pymmcore_eda.event_ring import EventRing
+from pymmcore_eda.codec import BinaryCodec, Decoder
+from queue import Empty, Full
+from useq import MDASequence
+import multiprocessing
+import pytest
+import select
+import socket
+
+sequence = MDASequence(
+    channels=[{"config": "DAPI", "exposure": 10}],
+    time_plan={"interval": 0, "loops": 200},
+    )
+
+
+def produce(ring: EventRing):
+    codec = BinaryCodec()
+    ring.put(codec.encode_sequence_started(sequence))
+    for i, event in enumerate(sequence):
+        ring.put(codec.encode_frame_ready(event, (512, 512), i))
+    ring.put({"name": "stop"})
+
+
+def test_roundtrip():
+    ring = EventRing(slots=4, slot_size=16)
+    ring.put(b"x"*5)
+    ring.put({"name": "stop"})
+    assert ring.get() == b"x"*5
+    assert ring.get() == {"name": "stop"}
+    assert ring.empty()
+    with pytest.raises(Empty):
+        ring.get(timeout=0.01)
+    ring.close()
+
+
+def test_full():
+    ring = EventRing(slots=2, slot_size=16)
+    ring.put(b"1")
+    ring.put(b"2")
+    with pytest.raises(Full):
+        ring.put_nowait(b"3")
+    with pytest.raises(ValueError):
+        ring.put(b"x"*100)
+    ring.close()
+
+
+def test_wrap_around():
+    ring = EventRing(slots=5, slot_size=8)
+    for i in range(100):
+        message = bytes([i])*(i % 20)
+        ring.put(message)
+        assert ring.get() == message
+    ring.close()
+
+
+def test_multiprocess():
+    ring = EventRing(slots=64, slot_size=128)
+    p = multiprocessing.Process(target=produce, args=(ring,))
+    p.start()
+    decoder = Decoder()
+    names = []
+    while True:
+        name, args = decoder.decode(ring.get(timeout=5))
+        if name == "stop":
+            break
+        names.append(name)
+        if name == "frame_ready":
+            assert args[0].index["t"] == len(names) - 2
+    p.join()
+    assert names[0] == "sequence_started"
+    assert len(names) == 201
+    ring.close()
+
+
+def test_wakeup():
+    ring = EventRing(slots=4, slot_size=16)
+    wake = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    wake.bind(("127.0.0.1", 0))
+    ring.set_wakeup(wake.getsockname()[1])
+    ring.put(b"1")
+    assert not ring.prepare_wait()
+    ring.get()
+    assert ring.prepare_wait()
+    assert select.select([wake], [], [], 0.01)[0] == []
+    ring.put(b"2")
+    assert select.select([wake], [], [], 1)[0] == [wake]
+    wake.close()
+    ring.close()
@@ -0,0 +1,72 @@
+import time
+import numpy as np
+from pymmcore_eda.frame_cache import FrameCache, prefetch_keys
+
+
+class SlowDatastore:
+    def __init__(self, shape=(20, 2, 2, 64, 64)):
+        self.array = np.arange(np.prod(shape), dtype=np.uint16).reshape(shape)
+        self.calls = []
+
+    def get_frame(self, key):
+        self.calls.append(tuple(key))
+        time.sleep(0.001)
+        return self.array[*key]
+
+
+def test_lru_budget():
+    datastore = SlowDatastore()
+    frame_bytes = 64*64*2
+    cache = FrameCache(datastore, budget=3*frame_bytes)
+    for t in range(4):
+        cache.get([t, 0, 0])
+    assert cache.nbytes == 3*frame_bytes
+    assert (0, 0, 0) not in cache
+    cache.get([1, 0, 0])
+    cache.get([4, 0, 0])
+    assert (1, 0, 0) in cache and (2, 0, 0) not in cache
+    assert np.array_equal(cache.get([1, 0, 0]), datastore.array[1, 0, 0])
+    assert cache.hits == 2 and cache.misses == 5
+    cache.invalidate([1, 0, 0])
+    assert (1, 0, 0) not in cache
+    cache.close()
+
+
+def test_prefetch():
+    datastore = SlowDatastore()
+    cache = FrameCache(datastore)
+    keys = prefetch_keys({"t": 5, "z": 1}, "t", -1, {"t": 20, "z": 2}, channels=2, depth=8)
+    assert keys[:2] == [(4, 1, 0), (4, 1, 1)]
+    assert keys[-1] == (0, 1, 1)
+    cache.prefetch(keys)
+    deadline = time.time() + 2
+    while not all(key in cache for key in keys) and time.time() < deadline:
+        time.sleep(0.01)
+    calls = len(datastore.calls)
+    for key in keys:
+        cache.get(key)
+    assert len(datastore.calls) == calls
+    cache.prefetch([(30, 0, 0)])
+    cache.close()
+    assert prefetch_keys({"t": 19, "z": 0}, "t", 1, {"t": 20}, channels=1) == []
+
+
+def test_invalidated_while_loading():
+    datastore = SlowDatastore()
+    cache = FrameCache(datastore)
+    get_frame = datastore.get_frame
+
+    def acquire_while_loading(key):
+        frame = get_frame(key).copy()
+        # The frame is acquired and invalidated before the load has finished
+        datastore.array[*key] += 1
+        cache.invalidate(key)
+        return frame
+
+    datastore.get_frame = acquire_while_loading
+    stale = cache.get([3, 0, 0])
+    assert (3, 0, 0) not in cache
+    datastore.get_frame = get_frame
+    assert not np.array_equal(cache.get([3, 0, 0]), stale)
+    assert np.array_equal(cache.get([3, 0, 0]), datastore.array[3, 0, 0])
+    cache.close()
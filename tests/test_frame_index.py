@@ -0,0 +1,140 @@
+from pymmcore_eda.frame_index import (FrameIndex, FrameState, SharedFrameIndex, frame_state,
+                                      frame_stats, index_key, record_stats)
+import multiprocessing
+import time
+import numpy as np
+import pytest
+
+
+def test_key():
+    assert index_key({"t": 3, "c": 1}) == (1, 0, 3, 0, 0)
+    assert index_key([0, 0, 1]) == (0, 0, 1, 0, 0)
+    with pytest.raises(IndexError):
+        index_key([0, 0, 0, 0, 0, 0])
+
+
+def test_growth():
+    index = FrameIndex(capacity=2)
+    for t in range(12_000):
+        for p in range(2):
+            index.add({"t": t, "p": p, "c": 4}, offset=t*2 + p, shape=(16, 8))
+    assert len(index) == 24_000
+    assert index.shape() == (5, 1, 12_000, 2, 1)
+    record = index[{"t": 11_999, "p": 1, "c": 4}]
+    assert record["offset"] == 11_999*2 + 1
+    assert tuple(record["shape"]) == (16, 8)
+    assert [4, 0, 10, 1] in index
+
+
+def test_sparse_and_reacquired():
+    index = FrameIndex()
+    index.add({"t": 5_000, "z": 30}, offset=1, shape=(1, 1))
+    index.add({"t": 5_000, "z": 30}, offset=2, shape=(1, 1))
+    assert len(index) == 1
+    assert index[[0, 30, 5_000]]["offset"] == 2
+    assert len(index.records) == 1024
+    with pytest.raises(IndexError):
+        index[[0, 0, 0]]
+
+
+def lookup_remote(name: str, out_conn):
+    index = SharedFrameIndex(name=name, create=False)
+    record = index[{"t": 2, "c": 1}]
+    out_conn.send((int(record["offset"]), tuple(record["shape"]), record["dtype"]))
+    index.close()
+
+
+def test_shared_index():
+    index = SharedFrameIndex(capacity=4)
+    for t in range(3):
+        for c in range(2):
+            index.add({"t": t, "c": c}, offset=100*t + c, generation=0, shape=(512, 256),
+                      dtype=np.uint16, timestamp=t)
+    out_conn, in_conn = multiprocessing.Pipe()
+    p = multiprocessing.Process(target=lookup_remote, args=(index.name, out_conn))
+    p.start()
+    assert in_conn.recv() == (201, (512, 256), b"<u2")
+    p.join()
+    # Capacity is 4, the first two frames have been overwritten
+    assert len(index) == 4
+    assert [0, 0, 0] not in index
+    assert [1, 0, 0] not in index
+    assert index[[0, 0, 1]]["seq"] == 2
+    index.close()
+
+
+def test_shared_index_reuses_entries():
+    index = SharedFrameIndex(capacity=8)
+    for t in range(1_000):
+        index.add({"t": t}, offset=t, generation=0, shape=(1, 1), dtype=np.uint16, timestamp=0)
+    assert all([0, 0, t] in index for t in range(992, 1_000))
+    assert index[[0, 0, 999]]["offset"] == 999
+    index.close()
+
+
+def test_shared_index_miss():
+    index = SharedFrameIndex(capacity=2**12)
+    for t in range(3*2**12):
+        index.add({"t": t}, offset=t, generation=0, shape=(1, 1), dtype=np.uint16, timestamp=0)
+    start = time.perf_counter()
+    assert not any([0, 0, t] in index for t in range(100))
+    assert time.perf_counter() - start < 0.5
+    index.close()
+
+
+def test_shared_index_torn_read():
+    index = SharedFrameIndex(capacity=4)
+    index.add({"t": 0}, offset=0, generation=0, shape=(1, 1), dtype=np.uint16, timestamp=0)
+    # The writer is rewriting the record
+    index.records[0]["seq"] = np.iinfo(np.uint64).max
+    assert [0, 0, 0] not in index
+    index.records[0]["seq"] = 0
+    assert index[[0, 0, 0]]["offset"] == 0
+    index.close()
+
+
+def test_frame_state():
+    index = FrameIndex()
+    index.add([0, 0, 0], offset=60, generation=0, shape=(4, 10))
+    index.add([0, 0, 1], offset=0, generation=1, shape=(4, 10))
+    old = index[[0, 0, 0]].copy()
+    # Capacity 100, the second frame has wrapped around and written up to 40
+    assert frame_state(old, written=140, capacity=100) == FrameState.VALID
+    assert frame_state(old, written=161, capacity=100) == FrameState.EVICTED
+    index.add([0, 0, 0], offset=40, generation=1, shape=(4, 10))
+    latest = int(index[[0, 0, 0]]["seq"])
+    assert frame_state(old, written=140, capacity=100, latest_seq=latest) == FrameState.STALE
+    assert frame_state(index[[0, 0, 0]], 180, 100, latest) == FrameState.VALID
+
+
+def test_frame_stats():
+    img = np.zeros((64, 32), np.uint16)
+    img[:32] = 1000
+    img[0, 0] = 4095
+    stats = frame_stats(img)
+    assert stats["min"] == 0 and stats["max"] == 4095
+    assert stats["sum"] == 1000*32*32 - 1000 + 4095
+    assert stats["mean"] == stats["sum"]/img.size
+    assert stats["histogram_shift"] == 6
+    assert stats["histogram"].sum() == img.size
+    assert stats["histogram"][1000 >> 6] == 32*32 - 1
+    assert stats["histogram"][-1] == 1
+
+    floats = frame_stats(img.astype(np.float32))
+    assert floats["max"] == 4095 and floats["sum"] == stats["sum"]
+    assert not floats["histogram"].any()
+
+    # A single extreme pixel on any row is found
+    extremes = np.full_like(img, 1000)
+    extremes[3, 5] = 7
+    extremes[33, 1] = 60000
+    assert frame_stats(extremes)["min"] == 7 and frame_stats(extremes)["max"] == 60000
+
+    index = SharedFrameIndex(capacity=4)
+    index.add({"t": 1}, offset=0, generation=0, shape=img.shape, dtype=img.dtype, timestamp=0,
+              stats=stats)
+    stored = record_stats(index[[0, 0, 1]])
+    assert stored["max"] == 4095
+    assert np.array_equal(stored["histogram"], stats["histogram"])
+    assert stored["edges"][-1] == 64 << 6
+    index.close()
@@ -1,13 +1,17 @@
 import multiprocessing
+import threading
 import time
 from qtpy import QtWidgets, QtCore
 
 from pymmcore_plus import CMMCorePlus
-from pymmcore_eda.buffered_datastore import BufferedDataStore
+from pymmcore_eda.buffered_datastore import BufferedDataStore, FrameOverwrittenError
 from useq import MDASequence
 from pymmcore_eda.event_receiver import QEventReceiver
 from pymmcore_eda.event_sender import EventSender
-from pymmcore_eda.local_datastore import QDataStore
+from pymmcore_eda.local_datastore import QDataStore, QLocalDataStore, preallocate
+from pymmcore_eda.chunked_array import ChunkedArray
+import numpy as np
+import types
 import sys
 from logging import getLogger
 
@@ -60,6 +64,105 @@ def test_receive_from_remote(qtbot):
     print(datastore.get_frame([0,0,2]).shape)
 
 
+def test_receive_zero_copy(qtbot):
+    queue = multiprocessing.Queue()
+    receiver = QEventReceiver(queue)
+    out_conn, in_conn = multiprocessing.Pipe()
+    p = multiprocessing.Process(target=run_acquisition, args=([queue, out_conn]))
+    p.start()
+
+    name = in_conn.recv()
+    datastore = QDataStore(receiver, name, shape=[10, 10, 10, 512, 512], zero_copy=True)
+    assert not hasattr(datastore, "array")
+
+    if qtbot:
+        with qtbot.waitSignal(datastore.frame_ready, timeout=5000):
+            pass
+        with qtbot.waitSignal(datastore.frame_ready, timeout=5000):
+            pass
+
+    frame = datastore.get_frame([0, 0, 0])
+    assert frame.shape == (512, 512)
+    assert frame.flatten()[0] != 0
+    assert not frame.flags.writeable
+
+
+def test_overwritten_frame(qtbot):
+    "A frame that is gone from the ring buffer before it is received is dropped."
+    remote_datastore = BufferedDataStore(create=True)
+    for zero_copy in [False, True]:
+        receiver = QEventReceiver(multiprocessing.Queue(), auto_start=False)
+        datastore = QDataStore(receiver, remote_datastore._shm.name, shape=[1, 1, 1, 8, 8],
+                               zero_copy=zero_copy)
+
+        def overwritten(indeces):
+            raise FrameOverwrittenError(indeces)
+
+        datastore.remote_datastore.get_frame = overwritten
+        received = []
+        datastore.frame_ready.connect(received.append)
+        datastore.new_frame(list(sequence)[0], (8, 8), 0)
+        assert received == []
+    remote_datastore.close()
+
+
+def test_preallocate_open_time():
+    "Only the length in t decides whether the array grows in chunks."
+    datastore = types.SimpleNamespace(array=np.zeros((1, 1, 1, 8, 8), np.uint16),
+                                      dtype=np.dtype(np.uint16))
+    event_driven = MDASequence(channels=["DAPI", "FITC"], z_plan={"range": 2, "step": 1})
+    assert event_driven.sizes.get("t", 0) == 0
+    preallocate(datastore, event_driven, (8, 8))
+    assert isinstance(datastore.array, ChunkedArray)
+    assert datastore.array.shape == (1, 3, 2, 8, 8)
+    preallocate(datastore, MDASequence(time_plan={"interval": 0, "loops": 3}), (8, 8))
+    assert isinstance(datastore.array, np.ndarray) and datastore.array.shape == (3, 1, 1, 8, 8)
+
+
+def test_preallocate(qtbot):
+    datastore = QLocalDataStore(shape=[2, 1, 1, 512, 512])
+    allocation = datastore.array
+    long_sequence = MDASequence(
+        channels=[{"config": "DAPI", "exposure": 1}, {"config": "FITC", "exposure": 1}],
+        time_plan={"interval": 0, "loops": 5},
+        )
+    with qtbot.waitSignals([datastore.frame_ready]*10, timeout=5000):
+        mmcore.run_mda(long_sequence)
+    assert datastore.array.shape == (5, 1, 2, 512, 512)
+
+    allocation = datastore.array
+    with qtbot.waitSignals([datastore.frame_ready]*2, timeout=5000):
+        mmcore.run_mda(MDASequence(time_plan={"interval": 0, "loops": 2}))
+    assert datastore.array.shape == (2, 1, 1, 512, 512)
+    assert datastore.array.base is allocation
+
+
+def test_ingest_thread(qtbot):
+    datastore = QLocalDataStore(shape=[2, 1, 1, 512, 512])
+    threads = []
+    datastore.frame_ready.connect(lambda event: threads.append(threading.get_ident()),
+                                  QtCore.Qt.ConnectionType.DirectConnection)
+    with qtbot.waitSignals([datastore.frame_ready]*2, timeout=5000):
+        mmcore.run_mda(MDASequence(time_plan={"interval": 0, "loops": 2}))
+    assert threading.get_ident() not in threads
+    assert set(datastore.stats) == {(0, 0, 0), (1, 0, 0)}
+    assert datastore.get_stats([1, 0, 0])["max"] == datastore.get_frame([1, 0, 0]).max()
+    datastore.listener.stop()
+    assert not datastore.listener.isRunning()
+
+
+def test_sequence_order(qtbot):
+    datastore = QLocalDataStore(shape=[3, 1, 1, 512, 512])
+    received = []
+    datastore.sequence_started.connect(lambda sequence: received.append("started"))
+    datastore.frame_ready.connect(lambda event: received.append("frame"))
+    datastore.sequence_finished.connect(lambda sequence: received.append("finished"))
+    with qtbot.waitSignal(datastore.sequence_finished, timeout=5000):
+        mmcore.run_mda(MDASequence(time_plan={"interval": 0, "loops": 3}))
+    assert received == ["started", "frame", "frame", "frame", "finished"]
+    datastore.listener.stop()
+
+
 if __name__ == "__main__":
     app= QtWidgets.QApplication([])
     test_writing(None)
@@ -0,0 +1,56 @@
+import time
+import numpy as np
+from useq import MDAEvent, MDASequence
+from pymmcore_eda.codec import FrameEvent
+from pymmcore_eda.metadata_log import METADATA_RECORD, MetadataLog, event_record, load_log, query
+
+
+def test_append_and_query(tmp_path):
+    sequence = MDASequence(channels=["DAPI", "FITC"], time_plan={"interval": 0, "loops": 600})
+    log = MetadataLog(tmp_path/"run.frames.bin")
+    for event in sequence:
+        log.append(event)
+    records = log.read()
+    assert isinstance(records, np.memmap) and len(records) == 1200
+    frames = query(records, c=1, t=lambda t: t > 500)
+    assert len(frames) == 99
+    assert (records["t"][frames] > 500).all() and (records["c"][frames] == 1).all()
+    assert records["frame"][frames[0]] == 2*501 + 1
+    log.close()
+    assert len(query(load_log(tmp_path/"run.frames.bin"), t=0)) == 2
+
+
+def test_event_record():
+    event = MDAEvent(index={"t": 3, "c": 1}, exposure=10, x_pos=1.5)
+    record = event_record(event, frame=7, timestamp=12.)
+    assert record["t"] == 3 and record["c"] == 1 and record["z"] == 0
+    assert record["exposure"] == 10 and record["x_pos"] == 1.5 and np.isnan(record["y_pos"])
+    assert record["frame"] == 7 and record["timestamp"] == 12.
+    assert event_record(FrameEvent(event.index, timestamp=5., event=event))["timestamp"] == 5.
+    assert time.time() - event_record(event)["timestamp"] < 1
+
+
+def test_unclosed(tmp_path):
+    path = tmp_path/"crash.frames.bin"
+    log = MetadataLog(path)
+    log.extend(np.stack([event_record(MDAEvent(index={"t": t})) for t in range(5)]))
+    log.file.flush()
+    records = load_log(path)
+    assert records.dtype == METADATA_RECORD
+    assert list(records["t"]) == list(range(5))
+    log.close()
+
+
+def test_query_speed(tmp_path):
+    records = np.zeros(1_000_000, METADATA_RECORD)
+    records["t"] = np.arange(len(records))//2
+    records["c"] = np.arange(len(records)) % 2
+    path = tmp_path/"large.frames.bin"
+    log = MetadataLog(path)
+    log.extend(records)
+    log.close()
+    records = load_log(path)
+    start = time.perf_counter()
+    frames = query(records, c=1, t=lambda t: t > 500)
+    assert time.perf_counter() - start < 0.5
+    assert len(frames) == 500_000 - 501
@@ -0,0 +1,49 @@
+import pytest
+from pymmcore_eda.utility.index_slider import PlaybackEngine
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+def test_skip_frames():
+    clock = Clock()
+    engine = PlaybackEngine(fps=10, clock=clock)
+    engine.start(0, 9)
+    assert engine.next_value() is None
+    clock.now = 0.1
+    assert engine.next_value() == 1
+    # Showing the frame took 0.35 s, the frames in between are skipped
+    clock.now = 0.45
+    assert engine.next_value() == 4
+    assert engine.skipped == 2
+    clock.now = 1.2
+    assert engine.next_value() == 2
+    assert engine.shown == 3
+    assert engine.achieved_fps == pytest.approx(2.5)
+
+
+def test_modes():
+    clock = Clock()
+    engine = PlaybackEngine(fps=1, mode="pingpong", clock=clock)
+    engine.start(0, 3)
+    values = []
+    for second in range(1, 9):
+        clock.now = second
+        values.append(engine.next_value())
+    assert values == [1, 2, 3, 2, 1, 0, 1, 2]
+
+    engine = PlaybackEngine(fps=1, mode="step", clock=clock)
+    engine.start(2, 3)
+    clock.now += 5
+    assert engine.next_value() == 3
+    assert engine.next_value() is None
+    clock.now += 1
+    assert engine.next_value() == 0
+    assert engine.skipped == 0
+    with pytest.raises(ValueError):
+        PlaybackEngine(mode="bounce")
@@ -0,0 +1,133 @@
+from pymmcore_eda.pubsub import EventPublisher, EventSubscriber, Subscription, topic_of
+from multiprocessing.connection import Client
+from pymmcore_eda.codec import BinaryCodec, Decoder
+from useq import MDASequence
+import json
+import multiprocessing
+import pytest
+import threading
+import time
+
+sequence = MDASequence(
+    channels=[{"config": "DAPI", "exposure": 10}],
+    time_plan={"interval": 0, "loops": 20},
+    )
+
+
+def subscribe(address, topics, out_conn):
+    subscriber = EventSubscriber(address, topics)
+    out_conn.send("ready")
+    decoder = Decoder()
+    names = []
+    while True:
+        name, _ = decoder.decode(subscriber.get(timeout=5))
+        if name == "stop":
+            break
+        names.append(name)
+    out_conn.send(names)
+
+
+def publish(publisher: EventPublisher):
+    codec = BinaryCodec()
+    publisher.put(codec.encode_sequence_started(sequence))
+    for i, event in enumerate(sequence):
+        publisher.put(codec.encode_frame_ready(event, (512, 512), i))
+    publisher.put({"name": "stop"})
+
+
+def test_fan_out():
+    publisher = EventPublisher()
+    conns = []
+    processes = []
+    for topics in [["sequence_started", "frame_ready", "stop"], ["sequence_started", "stop"]]:
+        out_conn, in_conn = multiprocessing.Pipe()
+        p = multiprocessing.Process(target=subscribe, args=(publisher.address, topics, out_conn))
+        p.start()
+        assert in_conn.recv() == "ready"
+        conns.append(in_conn)
+        processes.append(p)
+    publish(publisher)
+    assert conns[0].recv() == ["sequence_started"] + ["frame_ready"]*20
+    assert conns[1].recv() == ["sequence_started"]
+    for p in processes:
+        p.join()
+    publisher.close()
+
+
+class SlowConnection:
+    def __init__(self):
+        self.go = threading.Event()
+        self.received = []
+
+    def send_bytes(self, data):
+        self.go.wait()
+        self.received.append(data[1:])
+
+    def close(self):
+        self.go.set()
+
+
+@pytest.mark.parametrize("policy, expected", [("drop_oldest", [b"0", b"8", b"9"]),
+                                              ("drop_newest", [b"0", b"1", b"2"]),
+                                              ("disconnect", [b"0"])])
+def test_slow_consumer(policy, expected):
+    connection = SlowConnection()
+    subscription = Subscription(connection, ["frame_ready"], buffer_size=2, policy=policy)
+    subscription.enqueue(b"0")
+    time.sleep(0.05)  # The send thread is now stuck with the first message
+    for i in range(1, 10):
+        subscription.enqueue(str(i).encode())
+    connection.go.set()
+    time.sleep(0.05)
+    assert connection.received == expected
+    assert subscription.closed == (policy == "disconnect")
+
+
+def test_disconnected_subscriber():
+    publisher = EventPublisher()
+    subscriber = EventSubscriber(publisher.address)
+    subscriber.close()
+    for _ in range(3):
+        publisher.put({"name": "stop"})
+        time.sleep(0.05)
+    assert not publisher.subscriptions["stop"]
+    publisher.close()
+
+
+def test_untrusted_clients():
+    publisher = EventPublisher()
+    silent = Client(publisher.address)
+    pickled = Client(publisher.address)
+    pickled.send({"topics": ["stop"]})
+    # Neither blocks the next subscriber
+    subscriber = EventSubscriber(publisher.address, ["stop"])
+    publisher.put({"name": "stop"})
+    assert subscriber.get(timeout=1) == {"name": "stop"}
+    assert pickled.recv_bytes().startswith(b"error")
+    with pytest.raises(EOFError):
+        pickled.recv_bytes()
+    assert all(len(subscriptions) <= 1 for subscriptions in publisher.subscriptions.values())
+    for settings in [{"topics": ["stop"], "buffer_size": "8"},
+                     {"topics": ["stop"], "buffer_size": 1.5},
+                     {"topics": ["stop"], "buffer_size": 0},
+                     {"topics": ["stop"], "policy": "drop_everything"},
+                     {"topics": "stop"}, ["stop"]]:
+        client = Client(publisher.address)
+        client.send_bytes(json.dumps(settings).encode())
+        assert client.recv_bytes().startswith(b"error")
+        with pytest.raises(EOFError):
+            client.recv_bytes()
+    with pytest.raises(ConnectionError):
+        EventSubscriber(publisher.address, ["stop"], policy="drop_everything")
+    assert all(len(subscriptions) <= 1 for subscriptions in publisher.subscriptions.values())
+    publisher.put({"name": "stop"})
+    assert subscriber.get(timeout=1) == {"name": "stop"}
+    silent.close()
+    subscriber.close()
+    publisher.close()
+
+
+def test_topic():
+    codec = BinaryCodec()
+    assert topic_of(codec.encode_sequence_started(sequence)) == "sequence_started"
+    assert topic_of(codec.encode_frame_ready(list(sequence)[0], (1, 1), 0)) == "frame_ready"
@@ -0,0 +1,42 @@
+import numpy as np
+from pymmcore_eda.utility.pyramid import (Pyramid, PyramidBuilder, choose_level, downsample,
+                                          visible_region)
+
+
+def test_downsample():
+    img = np.arange(16, dtype=np.uint16).reshape(4, 4)
+    small = downsample(img)
+    assert small.dtype == np.uint16
+    assert small.tolist() == [[2, 4], [10, 12]]
+    assert downsample(np.ones((5, 7), np.float32)).shape == (2, 3)
+
+
+def test_pyramid():
+    pyramid = Pyramid(np.ones((2048, 2048), np.uint16), min_size=256)
+    assert len(pyramid) == 4
+    assert len(pyramid.levels) == 1
+    assert pyramid[2].shape == (512, 512)
+    assert len(pyramid.levels) == 3
+    assert pyramid[10].shape == (256, 256)
+    assert len(Pyramid(np.ones((100, 100)))) == 1
+    assert pyramid.is_built(10) and not Pyramid(np.ones((1024, 1024), np.uint16)).is_built(1)
+
+
+def test_builder(qtbot):
+    builder = PyramidBuilder()
+    pyramid = Pyramid(np.ones((1024, 1024), np.uint16), min_size=256)
+    with qtbot.waitSignal(builder.level_ready, timeout=1000) as blocker:
+        builder.submit(pyramid, 2, channel=1)
+    assert blocker.args == [1, pyramid]
+    assert pyramid.is_built(2) and pyramid.levels[2].shape == (256, 256)
+    builder.close()
+
+
+def test_level_and_region():
+    assert choose_level(0.5, 4) == 0
+    assert choose_level(4, 4) == 2
+    assert choose_level(100, 4) == 3
+    assert visible_region((0, 0, 2048, 2048), (512, 512), 2) == (slice(0, 512), slice(0, 512))
+    assert visible_region((300, 10, 200, 100), (2048, 2048), 0) == (slice(0, 256),
+                                                                    slice(256, 512))
+    assert visible_region((-500, -500, 100, 100), (2048, 2048), 0) == (slice(0, 0), slice(0, 0))
@@ -9,6 +9,7 @@ from pymmcore_eda.buffered_datastore import BufferedDataStore
 from useq import MDASequence
 from pymmcore_eda.event_receiver import QEventReceiver
 from pymmcore_eda.event_sender import EventSender
+from pymmcore_eda.event_ring import EventRing
 
 mmcore = CMMCorePlus.instance()
 mmcore.loadSystemConfiguration()
@@ -57,3 +58,12 @@ def test_multiprocess(qtbot):
 
 
     assert queue.empty() # Should have been received and popped by the EventReceiver
+
+
+def test_stop(qtbot):
+    receiver = QEventReceiver(EventRing())
+    qtbot.wait(100)
+    t0 = time.perf_counter()
+    receiver.stop()
+    assert time.perf_counter() - t0 < 0.1
+    assert receiver.event_thread.isFinished()
@@ -1,11 +1,16 @@
 from pymmcore_eda.local_datastore import QLocalDataStore
 from pymmcore_eda.saver import Saver
+from pymmcore_eda.metadata_log import load_log, query
 from pymmcore_plus import CMMCorePlus
 from useq import MDASequence
 from pathlib import Path
 import os
+import json
 import shutil
 import tifffile
+import time
+import pymmcore_eda.saver
+from pymmcore_eda.zarr_writer import ZarrWriter
 
 sequence = MDASequence(
     channels=[{"config": "DAPI", "exposure": 10}, {"config": "FITC", "exposure": 10}],
@@ -32,6 +37,75 @@ def test_local(qtbot):
 
     assert os.path.isfile("./data/test_save/images.ome.tif")
     assert os.path.isfile("./data/test_save/mm_data.txt")
+    assert len(load_log("./data/test_save/frames.bin")) == 20
     array = tifffile.imread("./data/test_save/images.ome.tif")
     assert array.shape == (10, 2, 512, 512)
-    saver.close()
\ No newline at end of file
+    saver.close()
+
+def test_streaming(qtbot, tmp_path):
+    datastore = QLocalDataStore(shape=[10, 1, 2, 512, 512])
+    saver = Saver(mmcore, datastore=datastore, streaming="zarr")
+    saver.save_location = str(tmp_path)
+    # The store is only finalized after all frames of the sequence are written
+    with qtbot.waitSignal(saver.stream_closed, timeout=15000):
+        mmcore.run_mda(sequence)
+    assert saver.writer.finished
+    assert saver.writer.frames_written == 20
+    assert len(list(tmp_path.glob("*.ome.zarr"))) == 1
+    records = load_log(next(tmp_path.glob("*.frames.bin")))
+    assert len(query(records, c=1)) == 10
+    saver.close()
+
+
+def test_streaming_back_to_back(qtbot, tmp_path):
+    datastore = QLocalDataStore(shape=[10, 1, 2, 512, 512])
+    saver = Saver(mmcore, datastore=datastore, streaming="zarr")
+    saver.save_location = str(tmp_path)
+    short = MDASequence(time_plan={"interval": 0, "loops": 3})
+    closed = []
+    saver.stream_closed.connect(closed.append)
+    mmcore.run_mda(sequence)
+    mmcore.run_mda(short)
+    qtbot.waitUntil(lambda: len(closed) == 2, timeout=20000)
+    shapes = sorted(json.loads((store/"0"/".zarray").read_text())["shape"][:3]
+                    for store in tmp_path.glob("*.ome.zarr"))
+    assert shapes == [[3, 1, 1], [10, 2, 1]]
+    assert sorted(len(load_log(log)) for log in tmp_path.glob("*.frames.bin")) == [3, 20]
+    saver.close()
+
+
+def test_streaming_tiff(qtbot, tmp_path):
+    datastore = QLocalDataStore(shape=[10, 1, 2, 512, 512])
+    saver = Saver(mmcore, datastore=datastore, streaming="tiff")
+    saver.save_location = str(tmp_path)
+    with qtbot.waitSignal(saver.stream_closed, timeout=15000):
+        mmcore.run_mda(sequence)
+    assert saver.writer.frames_written == 20 and saver.writer.errors == 0
+    assert tifffile.imread(next(tmp_path.glob("*.ome.tif"))).shape == (10, 2, 512, 512)
+    saver.close()
+
+
+class SlowWriter(ZarrWriter):
+    "A disk that is much slower than the acquisition."
+    def write(self, *args, **kwargs):
+        time.sleep(0.2)
+        super().write(*args, **kwargs)
+
+
+def test_slow_disk(qtbot, tmp_path, monkeypatch):
+    monkeypatch.setitem(pymmcore_eda.saver.WRITERS, "zarr", (SlowWriter, ".ome.zarr"))
+    datastore = QLocalDataStore(shape=[10, 1, 2, 512, 512])
+    saver = Saver(mmcore, datastore=datastore, streaming="zarr")
+    saver.save_location = str(tmp_path)
+    short = MDASequence(time_plan={"interval": 0, "loops": 5})
+    saver.on_sequence_start(short)
+    # Neither the frames nor the end of the sequence wait for the disk in the GUI thread
+    start = time.perf_counter()
+    for event in short:
+        saver.on_frame_ready(event)
+    with qtbot.waitSignal(saver.stream_closed, timeout=5000):
+        saver.on_sequence_finish(short)
+        assert time.perf_counter() - start < 0.2
+    assert saver.writer.frames_written == 5
+    assert len(load_log(next(tmp_path.glob("*.frames.bin")))) == 5
+    saver.close()
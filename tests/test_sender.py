@@ -3,6 +3,9 @@ from pymmcore_eda.buffered_datastore import BufferedDataStore
 from pymmcore_plus import CMMCorePlus
 from useq import MDASequence
 import multiprocessing
+import time
+import pytest
+from pymmcore_eda.event_ring import EventRing
 
 mmcore = CMMCorePlus.instance()
 mmcore.loadSystemConfiguration()
@@ -17,4 +20,25 @@ def test_events():
     sender = EventSender(datastore, queue)
     mmcore.run_mda(sequence, block=True)
     assert not queue.empty()
-    assert queue.get()["name"] in ["frame_ready", "sequence_started"]
\ No newline at end of file
+    assert queue.get()["name"] in ["frame_ready", "sequence_started"]
+
+def test_event_ring():
+    datastore = BufferedDataStore(create=True)
+    sender = EventSender(datastore)
+    ring = EventRing(name=f"{datastore._shm.name}_events", create=False)
+    mmcore.run_mda(sequence, block=True)
+    assert ring.get(timeout=1)["name"] == "sequence_started"
+    assert isinstance(ring.get(timeout=1), bytes)
+
+def test_full_ring():
+    datastore = BufferedDataStore(create=True)
+    sender = EventSender(datastore)
+    start = time.perf_counter()
+    for _ in range(sender.event_queue.slots + 100):
+        sender.put(b"x")
+    assert time.perf_counter() - start < 1
+    assert sender.dropped == 100
+    name = sender.event_queue.name
+    sender.closeEvent()
+    with pytest.raises(FileNotFoundError):
+        EventRing(name=name, create=False)
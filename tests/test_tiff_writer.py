@@ -0,0 +1,54 @@
+import numpy as np
+import tifffile
+from useq import MDASequence
+from pymmcore_eda.tiff_writer import TiffWriter
+
+
+def test_append(tmp_path):
+    sequence = MDASequence(channels=["DAPI", "FITC"], time_plan={"interval": 0, "loops": 3},
+                           z_plan={"range": 1, "step": 1}, axis_order="tpcz")
+    path = tmp_path/"run.ome.tif"
+    writer = TiffWriter(path, queue_size=2)
+    writer.start(sequence)
+    for event in sequence:
+        index = event.index
+        frame = np.full((16, 8), 100*index["t"] + 10*index["c"] + index["z"], np.uint16)
+        writer.write((index["t"], index["z"], index["c"]), frame)
+    writer.close()
+    assert writer.frames_written == 12 and writer.errors == 0
+    assert writer.stats()["depth_max"] <= 2
+    with tifffile.TiffFile(path) as tif:
+        assert tif.is_ome and tif.is_bigtiff
+        series = tif.series[0]
+        assert series.axes == "TCZYX"
+        data = series.asarray()
+    assert data.shape == (3, 2, 2, 16, 8)
+    assert data[2, 1, 0, 0, 0] == 210
+    assert data[1, 0, 1, 0, 0] == 101
+
+
+def test_incomplete(tmp_path):
+    path = tmp_path/"cut.ome.tif"
+    writer = TiffWriter(path)
+    writer.start(MDASequence(channels=["DAPI", "FITC"], time_plan={"interval": 0, "loops": 3}))
+    for i in range(3):
+        writer.write((i//2, 0, i % 2), np.full((4, 4), i, np.uint16))
+    writer.close()
+    with tifffile.TiffFile(path) as tif:
+        assert tif.series[0].shape == (3, 4, 4)
+
+
+def test_out_of_order(tmp_path):
+    "Pages that don't follow the axis order are not labelled with it."
+    sequence = MDASequence(channels=["DAPI", "FITC"], time_plan={"interval": 0, "loops": 2},
+                           axis_order="tpcz")
+    path = tmp_path/"relative.ome.tif"
+    writer = TiffWriter(path)
+    writer.start(sequence)
+    for key in [(0, 0, 1), (0, 0, 0), (1, 0, 0), (1, 0, 1)]:
+        writer.write(key, np.full((4, 4), 10*key[0] + key[2], np.uint16))
+    writer.close()
+    with tifffile.TiffFile(path) as tif:
+        series = tif.series[0]
+        assert series.axes == "TYX"
+        assert list(series.asarray()[:, 0, 0]) == [1, 0, 10, 11]
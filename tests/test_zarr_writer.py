@@ -0,0 +1,79 @@
+import json
+import zlib
+import numpy as np
+from useq import MDASequence
+from pymmcore_eda.compression import get_codec
+from pymmcore_eda.zarr_writer import ZarrWriter
+
+
+def read_chunk(path, t, c, z, shape):
+    return np.fromfile(path/"0"/str(t)/str(c)/str(z)/"0"/"0", np.uint16).reshape(shape)
+
+
+def test_stream(tmp_path):
+    sequence = MDASequence(channels=["DAPI", "FITC"], time_plan={"interval": 0, "loops": 3})
+    path = tmp_path/"run.ome.zarr"
+    writer = ZarrWriter(path, max_pending=2)
+    writer.start(sequence)
+    for event in sequence:
+        frame = np.full((16, 8), event.index["t"]*10 + event.index["c"], np.uint16)
+        writer.write((event.index["t"], 0, event.index["c"]), frame)
+    writer.finish()
+    assert writer.frames_written == 6 and writer.errors == 0
+    zarray = json.loads((path/"0"/".zarray").read_text())
+    assert zarray["shape"] == [3, 2, 1, 16, 8]
+    assert zarray["chunks"] == [1, 1, 1, 16, 8]
+    assert zarray["dtype"] == "<u2"
+    attrs = json.loads((path/".zattrs").read_text())
+    assert [axis["name"] for axis in attrs["multiscales"][0]["axes"]] == ["t", "c", "z", "y", "x"]
+    assert read_chunk(path, 2, 1, 0, (16, 8)).max() == 21
+    writer.close()
+
+
+def test_open_ended(tmp_path):
+    path = tmp_path/"open.ome.zarr"
+    writer = ZarrWriter(path)
+    writer.start(MDASequence())
+    for t in range(5):
+        writer.write((t, 0, 0), np.full((4, 4), t, np.uint16))
+    writer.close()
+    assert json.loads((path/"0"/".zarray").read_text())["shape"] == [5, 1, 1, 4, 4]
+    assert read_chunk(path, 4, 0, 0, (4, 4)).max() == 4
+
+
+def test_compression(tmp_path):
+    path = tmp_path/"compressed.ome.zarr"
+    writer = ZarrWriter(path, compression="zlib")
+    writer.start(MDASequence())
+    frame = np.tile(np.arange(64, dtype=np.uint16), (64, 1))
+    for t in range(4):
+        writer.write((t, 0, 0), frame + t)
+    writer.close()
+    zarray = json.loads((path/"0"/".zarray").read_text())
+    assert zarray["compressor"] == {"id": "zlib", "level": 1}
+    chunk = zlib.decompress((path/"0"/"3"/"0"/"0"/"0"/"0").read_bytes())
+    assert np.array_equal(np.frombuffer(chunk, np.uint16).reshape(64, 64), frame + 3)
+    stats = writer.stats()["compression"]
+    assert stats["codec"] == "zlib" and stats["ratio"] > 1
+    assert stats["bytes_in"] == 4*frame.nbytes
+
+
+def test_codec_fallback():
+    codec = get_codec("zstd")
+    assert codec.name in ("zstd", "zlib")
+    assert codec.compress(b"\0"*1000) != b"\0"*1000
+
+
+def test_done_only_when_written(tmp_path):
+    path = tmp_path/"failing.ome.zarr"
+    writer = ZarrWriter(path)
+    writer.start(MDASequence())
+    # A file where the directory of the chunk should be
+    (path/"0").mkdir()
+    (path/"0"/"0").write_bytes(b"")
+    calls = []
+    writer.write((0, 0, 0), np.zeros((4, 4), np.uint16), lambda: calls.append("done"),
+                 lambda: calls.append("failed"))
+    writer.finish()
+    assert calls == ["failed"] and writer.errors == 1
+    writer.close()